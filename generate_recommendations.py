@@ -1 +1,426 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import defaultdict
 
+import numpy as np
+
+from utils.config_loader import config
+
+TRADE_ROOT = os.path.join(os.path.dirname(__file__), 'trade')
+CHECKPOINT_INTERVAL = 1.0  # seconds between trade state checkpoints
+LATENCY_BUFFER = 100000  # latest samples kept for latency percentiles
+
+
+def tick_time(tick):
+    """
+    Returns the tick's exchange timestamp, falling back to local time for ticks without one.
+    """
+    ts = tick.get('exchange_timestamp')
+    if isinstance(ts, datetime.datetime):
+        return ts
+    if isinstance(ts, str):
+        return datetime.datetime.fromisoformat(ts)
+    return datetime.datetime.now()
+
+
+def new_strategy_state():
+    return {'position': None, 'realized_pnl': 0.0, 'unrealized_pnl': 0.0, 'trades': [], 'signals': []}
+
+
+class LatencyRecorder:
+    """
+    Fixed-size ring buffer of latencies in microseconds.
+    """
+
+    def __init__(self, size=LATENCY_BUFFER):
+        self.samples = np.zeros(size)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds * 1e6
+        self.count += 1
+
+    def report(self):
+        data = self.samples[:min(self.count, len(self.samples))]
+        if not len(data):
+            return {'count': 0}
+        p50, p99 = np.percentile(data, [50, 99])
+        return {'count': self.count, 'p50_us': float(p50), 'p99_us': float(p99), 'max_us': float(data.max())}
+
+
+class Strategy:
+    """
+    Base class for engine strategies. Subclasses declare their tokens through engine.route()
+    in attach() and return a signal dict (or None) from on_tick().
+    """
+    name = 'strategy'
+
+    def attach(self, engine):
+        self.engine = engine
+
+    def on_tick(self, tick):
+        return None
+
+
+class AtmStraddleSell(Strategy):
+    """
+    Sell the ATM call and put once both legs are quoting; buy both back when spot moves
+    spot_move_pct away from entry, the combined premium hits the stop or the target.
+    """
+
+    def __init__(self, underlying, spot_token, option_tokens, step, lot_size, spot_move_pct=0.005,
+                 stop_pct=0.3, target_pct=0.5, max_trades=1):
+        self.underlying = underlying
+        self.name = f"atm_straddle_sell_{underlying.lower()}"
+        self.spot_token = spot_token
+        self.option_tokens = option_tokens  # callable returning {(strike, 'CE'/'PE'): token}
+        self.step = step
+        self.lot_size = lot_size
+        self.spot_move_pct = spot_move_pct
+        self.stop_pct = stop_pct
+        self.target_pct = target_pct
+        self.max_trades = max_trades
+        self.spot = None
+        self.legs = None
+        self.prices = {}
+
+    def attach(self, engine):
+        super().attach(engine)
+        engine.route(self.spot_token, self)
+        position = engine.strategy_state(self.name)['position']
+        if position:
+            # Restored open position: keep watching its legs
+            self.legs = [(leg['label'], leg['token']) for leg in position['legs']]
+            for leg in position['legs']:
+                engine.route(leg['token'], self)
+
+    def on_tick(self, tick):
+        engine = self.engine
+        token = tick['instrument_token']
+        state = engine.strategy_state(self.name)
+        if token == self.spot_token:
+            self.spot = tick['last_price']
+        else:
+            self.prices[token] = tick['last_price']
+
+        position = state['position']
+        if self.spot is None:
+            return None
+        if position is None:
+            if len(state['trades']) >= self.max_trades:
+                return None
+            if self.legs is None:
+                atm = int(round(self.spot / self.step) * self.step)
+                tokens = self.option_tokens()
+                legs = [(f"{atm}{t}", tokens.get((atm, t))) for t in ('CE', 'PE')]
+                if any(leg_token is None for _, leg_token in legs):
+                    return None
+                self.legs = legs
+                for _, leg_token in legs:
+                    engine.route(leg_token, self)
+            if any(leg_token not in self.prices for _, leg_token in self.legs):
+                return None
+            legs = [{'label': label, 'token': leg_token, 'side': -1, 'qty': self.lot_size,
+                     'entry_price': self.prices[leg_token]} for label, leg_token in self.legs]
+            return engine.open_position(self.name, legs, tick, spot=self.spot)
+
+        premium = sum(leg['entry_price'] for leg in position['legs'])
+        pnl_pct = position['pnl'] / (premium * self.lot_size) if premium else 0.0
+        spot_move = abs(self.spot - position['spot']) / position['spot']
+        if spot_move >= self.spot_move_pct:
+            return engine.close_position(self.name, tick, reason='spot_move')
+        if pnl_pct <= -self.stop_pct:
+            return engine.close_position(self.name, tick, reason='stop_loss')
+        if pnl_pct >= self.target_pct:
+            return engine.close_position(self.name, tick, reason='target')
+        return None
+
+
+class ReversalAtKeyZones(Strategy):
+    """
+    Mean reversion on a future: arm when price trades within zone_pct of the day's high or low,
+    enter against the move on the first tick back out of the zone with above-average volume,
+    exit at the target or stop.
+    """
+
+    def __init__(self, underlying, token, lot_size, zone_pct=0.001, target_pct=0.004, stop_pct=0.003,
+                 vol_mult=1.2):
+        self.name = f"reversal_key_zones_{underlying.lower()}"
+        self.token = token
+        self.lot_size = lot_size
+        self.zone_pct = zone_pct
+        self.target_pct = target_pct
+        self.stop_pct = stop_pct
+        self.vol_mult = vol_mult
+        self.armed = None
+        self.last_volume = None
+        self.avg_volume_delta = None
+
+    def attach(self, engine):
+        super().attach(engine)
+        engine.route(self.token, self)
+
+    def on_tick(self, tick):
+        engine = self.engine
+        price = tick['last_price']
+        volume = tick.get('volume_traded') or 0
+        delta = 0 if self.last_volume is None else max(volume - self.last_volume, 0)
+        self.last_volume = volume
+        vol_ok = self.avg_volume_delta is not None and delta > self.vol_mult * self.avg_volume_delta
+        self.avg_volume_delta = delta if self.avg_volume_delta is None else 0.95 * self.avg_volume_delta + 0.05 * delta
+
+        position = engine.strategy_state(self.name)['position']
+        if position is not None:
+            leg = position['legs'][0]
+            move = leg['side'] * (price - leg['entry_price']) / leg['entry_price']
+            if move >= self.target_pct:
+                return engine.close_position(self.name, tick, reason='target')
+            if move <= -self.stop_pct:
+                return engine.close_position(self.name, tick, reason='stop_loss')
+            return None
+
+        ohlc = tick.get('ohlc') or {}
+        high, low = ohlc.get('high'), ohlc.get('low')
+        if not high or not low:
+            return None
+        if price <= low * (1 + self.zone_pct):
+            self.armed = 'support'
+        elif price >= high * (1 - self.zone_pct):
+            self.armed = 'resistance'
+        elif self.armed and vol_ok:
+            side = 1 if self.armed == 'support' else -1
+            self.armed = None
+            legs = [{'label': 'FUT', 'token': self.token, 'side': side, 'qty': self.lot_size, 'entry_price': price}]
+            return engine.open_position(self.name, legs, tick)
+        return None
+
+
+class OIBreakout(Strategy):
+    """
+    Directional breakout on a future: after the opening range, go long above the range high
+    (short below the low) when open interest has grown oi_pct since the range closed.
+    """
+
+    def __init__(self, underlying, token, lot_size, range_end=datetime.time(9, 30), oi_pct=0.02,
+                 target_pct=0.006, stop_pct=0.003):
+        self.name = f"oi_breakout_{underlying.lower()}"
+        self.token = token
+        self.lot_size = lot_size
+        self.range_end = range_end
+        self.oi_pct = oi_pct
+        self.target_pct = target_pct
+        self.stop_pct = stop_pct
+        self.range_high = None
+        self.range_low = None
+        self.range_oi = None
+
+    def attach(self, engine):
+        super().attach(engine)
+        engine.route(self.token, self)
+
+    def on_tick(self, tick):
+        engine = self.engine
+        price = tick['last_price']
+        oi = tick.get('oi') or 0
+        if tick_time(tick).time() < self.range_end:
+            self.range_high = price if self.range_high is None else max(self.range_high, price)
+            self.range_low = price if self.range_low is None else min(self.range_low, price)
+            self.range_oi = oi
+            return None
+        if self.range_high is None:
+            return None
+
+        state = engine.strategy_state(self.name)
+        position = state['position']
+        if position is not None:
+            leg = position['legs'][0]
+            move = leg['side'] * (price - leg['entry_price']) / leg['entry_price']
+            if move >= self.target_pct:
+                return engine.close_position(self.name, tick, reason='target')
+            if move <= -self.stop_pct:
+                return engine.close_position(self.name, tick, reason='stop_loss')
+            return None
+
+        if state['trades'] or not self.range_oi or oi < self.range_oi * (1 + self.oi_pct):
+            return None
+        if price > self.range_high:
+            side = 1
+        elif price < self.range_low:
+            side = -1
+        else:
+            return None
+        legs = [{'label': 'FUT', 'token': self.token, 'side': side, 'qty': self.lot_size, 'entry_price': price}]
+        return engine.open_position(self.name, legs, tick, oi=oi)
+
+
+class StrategyEngine:
+    """
+    Event-driven strategy engine. Register on_ticks as a kite_ws tick listener; each tick is
+    dispatched only to the strategies routed to its token, positions are marked to market
+    incrementally, and trade state is checkpointed to trade/YYYY-MM-DD/trade_state.json by a
+    background thread.
+    """
+
+    def __init__(self, strategies, trade_root=TRADE_ROOT, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.strategies = strategies
+        self.routes = defaultdict(list)
+        self.open_legs = defaultdict(list)  # token -> [(strategy name, leg)] of open positions
+        self.lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.stopped = threading.Event()
+        self.checkpoint_interval = checkpoint_interval
+        self.tick_latency = LatencyRecorder()
+        self.signal_latency = LatencyRecorder()
+        today = datetime.date.today().isoformat()
+        self.state_path = os.path.join(trade_root, today, 'trade_state.json')
+        self.state = self.load_state()
+        for name, state in self.state['strategies'].items():
+            if state['position']:
+                for leg in state['position']['legs']:
+                    self.open_legs[leg['token']].append((name, leg))
+        for strategy in strategies:
+            self.state['strategies'].setdefault(strategy.name, new_strategy_state())
+            strategy.attach(self)
+        self.checkpoint_thread = threading.Thread(target=self._checkpoint_loop, name='trade-state-checkpoint',
+                                                  daemon=True)
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                try:
+                    state = json.load(f)
+                    print(f"♻️ Restored trade state from {self.state_path}")
+                    return state
+                except Exception:
+                    print(f"⚠️ Could not read {self.state_path}, starting fresh")
+        return {'date': datetime.date.today().isoformat(), 'strategies': {}}
+
+    def route(self, token, strategy):
+        if strategy not in self.routes[token]:
+            self.routes[token].append(strategy)
+
+    def strategy_state(self, name):
+        return self.state['strategies'][name]
+
+    def on_ticks(self, ticks):
+        received = time.perf_counter()
+        with self.lock:
+            for tick in ticks:
+                token = tick['instrument_token']
+                self._mark(token, tick['last_price'])
+                for strategy in self.routes.get(token, ()):
+                    try:
+                        signal = strategy.on_tick(tick)
+                    except Exception as e:
+                        print(f"⚠️ {strategy.name} failed on token {token}: {e}")
+                        continue
+                    if signal:
+                        self.signal_latency.add(time.perf_counter() - received)
+                        print(f"📣 {signal['strategy']} {signal['action']} ({signal.get('reason', 'entry')}) "
+                              f"pnl={signal['pnl']:.2f}")
+            self.tick_latency.add(time.perf_counter() - received)
+
+    def _mark(self, token, price):
+        # Incremental mark-to-market: only legs on this token change
+        for name, leg in self.open_legs.get(token, ()):
+            delta = leg['side'] * leg['qty'] * (price - leg['ltp'])
+            leg['ltp'] = price
+            state = self.state['strategies'][name]
+            state['position']['pnl'] += delta
+            state['unrealized_pnl'] += delta
+            self.dirty.set()
+
+    def open_position(self, name, legs, tick, **extra):
+        state = self.state['strategies'][name]
+        for leg in legs:
+            leg['ltp'] = leg['entry_price']
+            self.open_legs[leg['token']].append((name, leg))
+        state['position'] = {'entry_time': tick_time(tick).isoformat(), 'legs': legs, 'pnl': 0.0, **extra}
+        return self._signal(name, 'ENTRY', tick, legs=[dict(leg) for leg in legs], pnl=0.0, **extra)
+
+    def close_position(self, name, tick, reason):
+        state = self.state['strategies'][name]
+        position = state['position']
+        for leg in position['legs']:
+            self.open_legs[leg['token']] = [(n, l) for n, l in self.open_legs[leg['token']] if l is not leg]
+        pnl = position['pnl']
+        state['realized_pnl'] += pnl
+        state['unrealized_pnl'] -= pnl
+        position.update({'exit_time': tick_time(tick).isoformat(), 'exit_reason': reason})
+        state['trades'].append(position)
+        state['position'] = None
+        return self._signal(name, 'EXIT', tick, reason=reason, pnl=pnl)
+
+    def _signal(self, name, action, tick, **details):
+        signal = {'strategy': name, 'action': action, 'time': tick_time(tick).isoformat(), **details}
+        self.state['strategies'][name]['signals'].append(signal)
+        self.dirty.set()
+        return signal
+
+    def start(self):
+        self.checkpoint_thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.checkpoint_thread.join()
+        self.checkpoint()
+
+    def _checkpoint_loop(self):
+        while not self.stopped.wait(self.checkpoint_interval):
+            if self.dirty.is_set():
+                self.checkpoint()
+
+    def checkpoint(self):
+        # Serialize under the lock, write outside it so tick dispatch never waits on disk
+        with self.lock:
+            self.dirty.clear()
+            self.state['updated_at'] = datetime.datetime.now().isoformat()
+            payload = json.dumps(self.state, indent=2, default=str)
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.state_path)
+
+    def latency_report(self):
+        return {'batch_dispatch': self.tick_latency.report(), 'tick_to_signal': self.signal_latency.report()}
+
+
+def build_strategies(kite_ws):
+    tokens = kite_ws.tokens_dict
+    nifty_lot = config.getint("contracts", "nifty_lot_size")
+    banknifty_lot = config.getint("contracts", "banknifty_lot_size")
+    return [
+        AtmStraddleSell('NIFTY', tokens['NIFTY_SPOT'], lambda: kite_ws.nifty_opts, 50, nifty_lot),
+        AtmStraddleSell('BANKNIFTY', tokens['BANKNIFTY_SPOT'], lambda: kite_ws.bn_opts, 100, banknifty_lot),
+        ReversalAtKeyZones('NIFTY', tokens['NIFTY_FUT'], nifty_lot),
+        ReversalAtKeyZones('BANKNIFTY', tokens['BANKNIFTY_FUT'], banknifty_lot),
+        OIBreakout('NIFTY', tokens['NIFTY_FUT'], nifty_lot),
+        OIBreakout('BANKNIFTY', tokens['BANKNIFTY_FUT'], banknifty_lot),
+    ]
+
+
+def main():
+    from utils import kite_ws
+
+    engine = StrategyEngine(build_strategies(kite_ws))
+    kite_ws.add_tick_listener(engine.on_ticks)
+    engine.start()
+    kite_ws.start_ws()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"⏱️ Latency: {engine.latency_report()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+        print(f"💾 Trade state saved to {engine.state_path}")
+        print(f"⏱️ Latency: {engine.latency_report()}")
+
+
+if __name__ == "__main__":
+    main()
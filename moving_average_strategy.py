@@ -1,8 +1,28 @@
+import hashlib
+import inspect
 import os
+import numpy as np
 import pandas as pd
 import configparser
 from glob import glob
 
+from utils.backtest_cache import (
+    file_digests,
+    load_cache_entry,
+    params_key,
+    prefix_ends_line,
+    save_cache_entry,
+    state_from_json,
+    state_to_json,
+)
+from utils.profiling import profiled_job, profiler
+
+# Parameters for the EMA cross strategy; part of the result cache key
+STRATEGY_PARAMS = {'lookback': 50, 'vol_window': 20, 'min_vol_mult': 1.2, 'min_breakout_pct': 0.005}
+
+RECENT_CROSS_COLUMNS = ['symbol', 'date', 'type', 'close', 'ema50', 'next_close', 'pl_1d', 'pl_1d_result',
+                        'next_close_1w', 'pl_1w', 'pl_1w_result']
+
 def read_config(config_path='config/config.conf'):
     config = configparser.ConfigParser()
     config.read(config_path)
@@ -11,6 +31,17 @@ def read_config(config_path='config/config.conf'):
     base_history_path = config['settings']['base_history_path']
     return from_date, to_date, base_history_path
 
+def read_backtest_config(config_path='config/config.conf'):
+    """
+    Returns (streaming, chunksize, cache) for the backtest from the [backtest] section.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    streaming = config.getboolean('backtest', 'streaming', fallback=False)
+    chunksize = config.getint('backtest', 'chunksize', fallback=100000)
+    cache = config.getboolean('backtest', 'cache', fallback=False)
+    return streaming, chunksize, cache
+
 def recent_ema_crosses(df, lookback=50, vol_window=20, min_vol_mult=1.2, min_breakout_pct=0.005):
     df = df.copy()
     df['EMA50'] = df['close'].ewm(span=lookback, adjust=False).mean()
@@ -64,83 +95,423 @@ def recent_ema_crosses(df, lookback=50, vol_window=20, min_vol_mult=1.2, min_bre
     return pd.DataFrame(crosses)
 
 
+def _cross_records(buf, positions, kind):
+    """
+    Build cross records for the given buffer positions, matching the columns of recent_ema_crosses.
+    """
+    close = buf['close'].to_numpy(dtype=float)
+    rows = buf.iloc[positions]
+    cur = close[positions]
+    next_1d = close[positions + 1]
+    next_1w = close[positions + 5]
+    if kind == 'Support':
+        pl_1d, pl_1w = cur - next_1d, cur - next_1w
+    else:
+        pl_1d, pl_1w = next_1d - cur, next_1w - cur
+    return pd.DataFrame({
+        'date': rows['date'].to_numpy(),
+        'type': kind,
+        'close': rows['close'].to_numpy(),
+        'ema50': rows['EMA50'].to_numpy(),
+        'volume': rows['volume'].to_numpy(),
+        'vol_sma': rows['vol_sma'].to_numpy(),
+        'next_close': next_1d,
+        'pl_1d': pl_1d,
+        'pl_1d_result': np.where(pl_1d > 0, "Profit", "Loss"),
+        'next_close_1w': next_1w,
+        'pl_1w': pl_1w,
+        'pl_1w_result': np.where(pl_1w > 0, "Profit", "Loss"),
+    }, index=positions)
+
+
+def new_stream_state():
+    """
+    Returns the carry-over state stream_ema_crosses keeps between chunks.
+    """
+    return {
+        'columns': None,
+        'carry': None,
+        'last_ema': None,
+        'vol_tail': [],
+        'last_date': None,
+        'next_row': 2,  # rows 0 and 1 can never cross (no prev_close two bars back)
+        'row_offset': 0,
+    }
+
+
+def frame_stream_state(df, vol_window=20):
+    """
+    Build the stream state stream_ema_crosses would hold after reading all of df
+    (sorted, with EMA50 computed), so a later run can resume from appended rows.
+    """
+    n = len(df)
+    volume = df['volume'].astype(float)
+    carry = df.iloc[-7:].copy()
+    carry['row'] = np.arange(n - len(carry), n)
+    carry['vol_sma'] = volume.rolling(window=vol_window).mean().iloc[-7:].to_numpy()
+    state = new_stream_state()
+    state.update({
+        'columns': [c for c in df.columns if c != 'EMA50'],
+        'carry': carry,
+        'last_ema': df['EMA50'].iloc[-1],
+        'vol_tail': volume.iloc[-(vol_window - 1):].tolist() if vol_window > 1 else [],
+        'last_date': df['date'].iloc[-1],
+        'next_row': max(2, n - 5),
+        'row_offset': n,
+    })
+    return state
+
+
+def stream_ema_crosses(path, chunksize=100000, lookback=50, vol_window=20, min_vol_mult=1.2,
+                       min_breakout_pct=0.005, state=None, offset=0):
+    """
+    Streaming equivalent of recent_ema_crosses over a date-sorted history CSV.
+    Reads the file in chunks, carrying the EMA value, the volume tail for the rolling
+    mean and a few trailing rows (two bars of history plus the five-bar lookahead)
+    across chunk boundaries, so memory stays bounded by the chunk size.
+    Yields (ema_df, crosses_df) per chunk: ema_df holds date/close/EMA50 for the chunk,
+    crosses_df the crosses whose +1/+5 bars are now known.
+    state (see new_stream_state) is updated in place; pass a saved state together with
+    the byte offset it was taken at to resume on rows appended to the file since.
+    Raises ValueError if the file has no 'date' column or is not sorted by date.
+    """
+    if state is None:
+        state = {}
+    if not state:
+        state.update(new_stream_state())
+    with open(path, 'rb') as f:
+        if offset:
+            f.seek(offset)
+            reader = pd.read_csv(f, chunksize=chunksize, header=None, names=state['columns'])
+        else:
+            reader = pd.read_csv(f, chunksize=chunksize)
+        for chunk in profiler.iterate('csv_read', reader):
+            if 'date' not in chunk.columns:
+                raise ValueError(f"{path} has no 'date' column")
+            if chunk.empty:
+                continue
+            last_date = state['last_date']
+            with profiler.stage('sort'):
+                is_sorted = chunk['date'].is_monotonic_increasing
+            if not is_sorted or (last_date is not None and chunk['date'].iloc[0] < last_date):
+                raise ValueError(f"{path} is not sorted by date; use the in-memory backtest")
+            state['columns'] = list(chunk.columns)
+            state['last_date'] = chunk['date'].iloc[-1]
+            chunk = chunk.reset_index(drop=True)
+            row_offset = state['row_offset']
+            chunk['row'] = np.arange(row_offset, row_offset + len(chunk))
+            state['row_offset'] = row_offset + len(chunk)
+
+            # Seed the EMA with the previous chunk's last value; with adjust=False this
+            # continues the same recursion pandas runs over the whole column.
+            with profiler.stage('ema'):
+                last_ema = state['last_ema']
+                if last_ema is None or np.isnan(last_ema):
+                    chunk['EMA50'] = chunk['close'].ewm(span=lookback, adjust=False).mean()
+                else:
+                    seeded = pd.concat([pd.Series([last_ema]), chunk['close']], ignore_index=True)
+                    chunk['EMA50'] = seeded.ewm(span=lookback, adjust=False).mean().iloc[1:].to_numpy()
+                state['last_ema'] = chunk['EMA50'].iloc[-1]
+
+            with profiler.stage('cross_detection'):
+                vol_tail = pd.Series(state['vol_tail'], dtype=float)
+                volume = pd.concat([vol_tail, chunk['volume'].astype(float)], ignore_index=True)
+                chunk['vol_sma'] = volume.rolling(window=vol_window).mean().iloc[len(vol_tail):].to_numpy()
+                state['vol_tail'] = volume.iloc[-(vol_window - 1):].tolist() if vol_window > 1 else []
+
+                carry = state['carry']
+                buf = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+                rows = buf['row'].to_numpy()
+                positions = np.flatnonzero((rows >= state['next_row']) & (np.arange(len(buf)) + 5 < len(buf)))
+                crosses = pd.DataFrame()
+                if len(positions):
+                    close = buf['close'].to_numpy(dtype=float)
+                    ema = buf['EMA50'].to_numpy(dtype=float)
+                    vol = buf['volume'].to_numpy(dtype=float)
+                    vol_sma = buf['vol_sma'].to_numpy(dtype=float)
+                    cur_close, cur_ema = close[positions], ema[positions]
+                    prev_close, prev_ema = close[positions - 2], ema[positions - 2]
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        vol_ok = vol[positions] > min_vol_mult * vol_sma[positions]
+                        breakout = np.abs(cur_close - cur_ema) / cur_ema > min_breakout_pct
+                    signal = breakout & vol_ok
+                    support = positions[(prev_close > prev_ema) & (cur_close < cur_ema) & signal]
+                    resistance = positions[(prev_close < prev_ema) & (cur_close > cur_ema) & signal]
+                    parts = [_cross_records(buf, support, 'Support'), _cross_records(buf, resistance, 'Resistance')]
+                    crosses = pd.concat(parts).sort_index(kind='stable').reset_index(drop=True)
+                    state['next_row'] = int(rows[positions[-1]]) + 1
+                state['carry'] = buf.iloc[-7:].reset_index(drop=True)
+            yield chunk[['date', 'close', 'EMA50']], crosses
+
+
+def summarize_crosses(crosses_df):
+    """
+    Returns cross counts used by the summary files.
+    """
+    return {
+        'total': len(crosses_df),
+        'support': int((crosses_df['type'] == 'Support').sum()),
+        'resistance': int((crosses_df['type'] == 'Resistance').sum()),
+        'profit_1d': int((crosses_df['pl_1d_result'] == 'Profit').sum()),
+        'profit_1w': int((crosses_df['pl_1w_result'] == 'Profit').sum()),
+    }
+
+
+def add_counts(totals, counts):
+    for key, value in counts.items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def write_summary(path, counts, symbol=None):
+    total = counts['total']
+    summary = [] if symbol is None else [f"Symbol: {symbol}"]
+    summary += [
+        f"Total crosses: {total}",
+        f"Support crosses: {counts['support']}",
+        f"Resistance crosses: {counts['resistance']}",
+        f"1D Profit: {counts['profit_1d']} / {total} ({counts['profit_1d'] / total:.2%})",
+        f"1W Profit: {counts['profit_1w']} / {total} ({counts['profit_1w'] / total:.2%})"
+    ]
+    with open(path, 'w') as f:
+        f.write('\n'.join(summary))
+
+
+def append_csv(df, path, written):
+    """
+    Write df to path, truncating on the first call (written=False) and appending afterwards.
+    """
+    df.to_csv(path, mode='a' if written else 'w', header=not written, index=False)
+    return True
+
+
+def backtest_symbol(file, symbol, symbol_dir):
+    """
+    In-memory backtest of one history file.
+    Returns (crosses_df, state): state is the resumable stream state when the file was
+    already sorted by date, else None. Returns (None, None) if the file has no 'date' column.
+    """
+    with profiler.stage('csv_read'):
+        df = pd.read_csv(file)
+    if 'date' not in df.columns:
+        return None, None
+    with profiler.stage('sort'):
+        was_sorted = df['date'].is_monotonic_increasing
+        df = df.sort_values('date').reset_index(drop=True)
+
+    # Save full EMA50 history for this stock
+    with profiler.stage('ema'):
+        df['EMA50'] = df['close'].ewm(span=STRATEGY_PARAMS['lookback'], adjust=False).mean()
+    ema_out = df[['date', 'close', 'EMA50']]
+    with profiler.stage('csv_write'):
+        ema_out.to_csv(os.path.join(symbol_dir, 'ema50_history.csv'), index=False)
+
+    # For breaks_analysis.csv, use all data
+    with profiler.stage('cross_detection'):
+        full_crosses_df = recent_ema_crosses(df, **STRATEGY_PARAMS)
+    if not full_crosses_df.empty:
+        full_crosses_df['symbol'] = symbol
+        with profiler.stage('csv_write'):
+            full_crosses_df.to_csv(os.path.join(symbol_dir, 'breakout_analysis.csv'), index=False)
+    state = frame_stream_state(df, vol_window=STRATEGY_PARAMS['vol_window']) if was_sorted and len(df) else None
+    return full_crosses_df, state
+
+
+def stream_backtest_symbol(file, symbol, symbol_dir, chunksize, on_crosses=None, state=None, offset=0, counts=None):
+    """
+    Streaming backtest of one history file. EMA history and crosses are written as each
+    chunk completes; once the whole file is done, its crosses are replayed into
+    on_crosses(crosses_df) if given.
+    A file that turns out not to be sorted by date (or to lack a 'date' column) falls back to
+    the in-memory backtest, discarding any partial outputs, and state is replaced by its state.
+    With a saved state and byte offset, only the rows appended after offset are processed
+    and appended to the existing outputs, adding to counts; a ValueError is raised instead
+    of falling back.
+    Returns the summary counts, or None if the file has no 'date' column.
+    """
+    counts = dict(counts or {})
+    ema_path = os.path.join(symbol_dir, 'ema50_history.csv')
+    crosses_path = os.path.join(symbol_dir, 'breakout_analysis.csv')
+    ema_written = bool(offset)
+    crosses_written = bool(offset) and os.path.exists(crosses_path)
+    try:
+        for ema_df, crosses in stream_ema_crosses(file, chunksize=chunksize, state=state, offset=offset,
+                                                  **STRATEGY_PARAMS):
+            with profiler.stage('csv_write'):
+                ema_written = append_csv(ema_df, ema_path, ema_written)
+            if crosses.empty:
+                continue
+            crosses['symbol'] = symbol
+            with profiler.stage('csv_write'):
+                crosses_written = append_csv(crosses, crosses_path, crosses_written)
+            add_counts(counts, summarize_crosses(crosses))
+    except ValueError as e:
+        if offset:
+            raise
+        print(f"⚠️ {symbol}: {e}; falling back to the in-memory backtest")
+        for path in (ema_path, crosses_path):
+            if os.path.exists(path):
+                os.remove(path)
+        full_crosses_df, fallback_state = backtest_symbol(file, symbol, symbol_dir)
+        ema_written = True
+        if state is not None:
+            state.clear()
+            state.update(fallback_state or {})
+        if full_crosses_df is None:
+            print(f"⚠️ Skipped {symbol}: no 'date' column")
+            return None
+        counts = summarize_crosses(full_crosses_df) if not full_crosses_df.empty else {}
+    if not ema_written:
+        # Header-only file: leave the same empty EMA history the in-memory backtest writes
+        append_csv(pd.DataFrame(columns=['date', 'close', 'EMA50']), ema_path, False)
+    if counts and on_crosses is not None:
+        replay_cached_crosses(symbol_dir, on_crosses)
+    return counts
+
+
+def strategy_code_version():
+    """
+    Hash of the strategy source, so editing the cross logic invalidates cached results.
+    """
+    funcs = [recent_ema_crosses, _cross_records, new_stream_state, frame_stream_state, stream_ema_crosses]
+    source = ''.join(inspect.getsource(func) for func in funcs)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def replay_cached_crosses(symbol_dir, on_crosses):
+    path = os.path.join(symbol_dir, 'breakout_analysis.csv')
+    if os.path.exists(path):
+        with profiler.stage('csv_read'):
+            crosses = pd.read_csv(path, float_precision='round_trip')
+        on_crosses(crosses)
+
+
+def use_cached_entry(entry, symbol, symbol_dir, on_crosses):
+    print(f"⏭️ {symbol} unchanged, using cached results")
+    counts = entry['counts'] or None
+    if counts:
+        replay_cached_crosses(symbol_dir, on_crosses)
+    return counts
+
+
+def cached_backtest_symbol(file, symbol, symbol_dir, streaming, chunksize, key, on_crosses):
+    """
+    Backtest one history file through the per-symbol result cache.
+    Files whose size and mtime match the entry are taken as unchanged without reading them;
+    otherwise the file is hashed, and unchanged content (same hash and key) reuses the stored
+    outputs, files that only had rows appended resume from the stored stream state, and
+    anything else is recomputed in full. Crosses for the symbol are then replayed into on_crosses.
+    Returns the summary counts, or None if the symbol has no crosses or no 'date' column.
+    """
+    entry = load_cache_entry(symbol_dir)
+    if entry is not None and entry.get('key') != key:
+        entry = None
+    # Stat before reading, so a write landing mid-run leaves a stale mtime and forces a re-hash
+    mtime_ns = os.stat(file).st_mtime_ns
+    if entry is not None and (entry['size'], entry.get('mtime_ns')) == (os.path.getsize(file), mtime_ns):
+        return use_cached_entry(entry, symbol, symbol_dir, on_crosses)
+
+    prefix_size = entry['size'] if entry is not None and entry.get('state') else None
+    with profiler.stage('cache_check'):
+        size, digest, prefix_digest = file_digests(file, prefix_size)
+
+    if entry is not None and entry['sha256'] == digest:
+        # Touched but not modified: record the new mtime so the next run skips hashing
+        save_cache_entry(symbol_dir, dict(entry, mtime_ns=mtime_ns))
+        return use_cached_entry(entry, symbol, symbol_dir, on_crosses)
+
+    counts = state = None
+    resumed = False
+    if (prefix_digest is not None and prefix_digest == entry['sha256'] and size > entry['size']
+            and prefix_ends_line(file, entry['size'])):
+        state = state_from_json(entry['state'])
+        try:
+            counts = stream_backtest_symbol(file, symbol, symbol_dir, chunksize,
+                                            state=state, offset=entry['size'], counts=entry['counts'])
+            resumed = True
+            print(f"🔁 {symbol} grew by {size - entry['size']} bytes, processed appended rows only")
+        except ValueError as e:
+            print(f"⚠️ Could not resume {symbol} ({e}), recomputing")
+
+    if not resumed:
+        # Drop outputs from the previous run so a symbol with no crosses leaves none behind
+        for name in ('breakout_analysis.csv', 'summary.txt'):
+            path = os.path.join(symbol_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        if streaming:
+            state = {}
+            counts = stream_backtest_symbol(file, symbol, symbol_dir, chunksize, state=state)
+        else:
+            full_crosses_df, state = backtest_symbol(file, symbol, symbol_dir)
+            if full_crosses_df is None:
+                return None
+            # Symbols without crosses are cached with empty counts, as in the streaming branch
+            counts = summarize_crosses(full_crosses_df) if not full_crosses_df.empty else {}
+        if counts is None:
+            return None
+
+    save_cache_entry(symbol_dir, {
+        'key': key,
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'sha256': digest,
+        'counts': counts or {},
+        'state': state_to_json(state) if state else None,
+    })
+    if counts:
+        replay_cached_crosses(symbol_dir, on_crosses)
+    return counts or None
+
+
+@profiled_job('moving_average_strategy')
 def main():
     from_date, to_date, base_history_path = read_config()
+    streaming, chunksize, cache = read_backtest_config()
+    cache_key = params_key(STRATEGY_PARAMS, strategy_code_version())
     folder = os.path.join(base_history_path, f"{from_date}_{to_date}")
     csv_files = glob(os.path.join(folder, "*_historical.csv"))
-    recent_crosses_all = []
+    recent_path = 'results/recent_50day_ema_crosses.csv'
+    recent_written = False
+    global_counts = {}
 
     os.makedirs('results', exist_ok=True)
 
+    def add_recent(crosses_df):
+        # Append crosses to the global CSV as each symbol (or chunk) finishes
+        nonlocal recent_written
+        with profiler.stage('csv_write'):
+            recent_written = append_csv(crosses_df[RECENT_CROSS_COLUMNS], recent_path, recent_written)
+        add_counts(global_counts, summarize_crosses(crosses_df))
+
     for file in csv_files:
         symbol = os.path.basename(file).replace('_historical.csv', '')
         symbol_dir = os.path.join('results', symbol)
         os.makedirs(symbol_dir, exist_ok=True)
 
-        df = pd.read_csv(file)
-        if 'date' not in df.columns:
-            continue
-        df = df.sort_values('date').reset_index(drop=True)
+        with profiler.symbol(symbol):
+            if cache:
+                counts = cached_backtest_symbol(file, symbol, symbol_dir, streaming, chunksize, cache_key, add_recent)
+            elif streaming:
+                counts = stream_backtest_symbol(file, symbol, symbol_dir, chunksize, add_recent)
+            else:
+                full_crosses_df, _ = backtest_symbol(file, symbol, symbol_dir)
+                if full_crosses_df is None:
+                    continue
+                counts = summarize_crosses(full_crosses_df) if not full_crosses_df.empty else None
+                if counts:
+                    add_recent(full_crosses_df)
 
-        # Save full EMA50 history for this stock
-        df['EMA50'] = df['close'].ewm(span=50, adjust=False).mean()
-        ema_out = df[['date', 'close', 'EMA50']]
-        ema_out.to_csv(os.path.join(symbol_dir, 'ema50_history.csv'), index=False)
-
-        # For breaks_analysis.csv, use all data
-        full_crosses_df = recent_ema_crosses(df)
-        if not full_crosses_df.empty:
-            full_crosses_df['symbol'] = symbol
-            full_crosses_df.to_csv(os.path.join(symbol_dir, 'breakout_analysis.csv'), index=False)
+            # For summary.txt, use all data
+            if counts:
+                with profiler.stage('csv_write'):
+                    write_summary(os.path.join(symbol_dir, 'summary.txt'), counts, symbol=symbol)
 
-        # For summary.txt, use all data
-        if not full_crosses_df.empty:
-            total = len(full_crosses_df)
-            support = full_crosses_df[full_crosses_df['type'] == 'Support']
-            resistance = full_crosses_df[full_crosses_df['type'] == 'Resistance']
-            profit_1d = (full_crosses_df['pl_1d_result'] == 'Profit').sum()
-            profit_1w = (full_crosses_df['pl_1w_result'] == 'Profit').sum()
-            summary = [
-                f"Symbol: {symbol}",
-                f"Total crosses: {total}",
-                f"Support crosses: {len(support)}",
-                f"Resistance crosses: {len(resistance)}",
-                f"1D Profit: {profit_1d} / {total} ({profit_1d / total:.2%})",
-                f"1W Profit: {profit_1w} / {total} ({profit_1w / total:.2%})"
-            ]
-            with open(os.path.join(symbol_dir, 'summary.txt'), 'w') as f:
-                f.write('\n'.join(summary))
-
-        # For global recent crosses, use only last 50 days
-        crosses_df = recent_ema_crosses(df, lookback=50)
-        crosses_list = crosses_df.to_dict('records')
-        for c in crosses_list:
-            c['symbol'] = symbol
-            recent_crosses_all.append(c)
-
-    # Save all recent crosses to a summary CSV with all columns
-    if recent_crosses_all:
-        out_df = pd.DataFrame(recent_crosses_all)
-        out_df = out_df[['symbol', 'date', 'type', 'close', 'ema50', 'next_close', 'pl_1d', 'pl_1d_result',
-                         'next_close_1w', 'pl_1w', 'pl_1w_result']]
-        out_df.to_csv('results/recent_50day_ema_crosses.csv', index=False)
-        print("Recent 50-day EMA crosses saved to `results/recent_50day_ema_crosses.csv`.")
+    if recent_written:
+        print(f"Recent 50-day EMA crosses saved to `{recent_path}`.")
 
         # Global summary
-        total = len(out_df)
-        support = out_df[out_df['type'] == 'Support']
-        resistance = out_df[out_df['type'] == 'Resistance']
-        profit_1d = (out_df['pl_1d_result'] == 'Profit').sum()
-        profit_1w = (out_df['pl_1w_result'] == 'Profit').sum()
-        summary = [
-            f"Total crosses: {total}",
-            f"Support crosses: {len(support)}",
-            f"Resistance crosses: {len(resistance)}",
-            f"1D Profit: {profit_1d} / {total} ({profit_1d / total:.2%})",
-            f"1W Profit: {profit_1w} / {total} ({profit_1w / total:.2%})"
-        ]
-        with open('results/summary.txt', 'w') as f:
-            f.write('\n'.join(summary))
+        write_summary('results/summary.txt', global_counts)
         print("Summary saved to `results/summary.txt`.")
     else:
         print("No recent EMA crosses found in the last 50 days.")
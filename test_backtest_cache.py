@@ -0,0 +1,112 @@
+import filecmp
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import moving_average_strategy
+
+SYMBOL_OUTPUTS = ['ema50_history.csv', 'breakout_analysis.csv', 'summary.txt']
+GLOBAL_OUTPUTS = ['recent_50day_ema_crosses.csv', 'summary.txt']
+
+
+def history_frame(seed, start, count, flat=False):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2019-01-01', periods=start + count, freq='D')[start:].strftime('%Y-%m-%d')
+    if flat:
+        # Steady uptrend on constant volume: never passes the volume filter, so no crosses
+        close = 100.0 + 0.1 * np.arange(start, start + count)
+        volume = np.full(count, 1000)
+    else:
+        close = 100.0 + np.cumsum(rng.normal(0, 2, count))
+        volume = rng.integers(500, 3000, count)
+    return pd.DataFrame({'date': dates, 'open': close, 'high': close, 'low': close,
+                         'close': close, 'volume': volume})
+
+
+def write_config(run_dir, history_root, streaming, cache, chunksize=97):
+    os.makedirs(os.path.join(run_dir, 'config'), exist_ok=True)
+    with open(os.path.join(run_dir, 'config', 'config.conf'), 'w') as f:
+        f.write(f"[settings]\nfrom_date = a\nto_date = b\nbase_history_path = {history_root}\n"
+                f"[backtest]\nstreaming = {streaming}\nchunksize = {chunksize}\ncache = {cache}\n")
+
+
+def run_main(monkeypatch, run_dir):
+    monkeypatch.chdir(run_dir)
+    moving_average_strategy.main()
+
+
+def assert_same_results(left, right, symbols):
+    for name in GLOBAL_OUTPUTS:
+        assert filecmp.cmp(os.path.join(left, 'results', name), os.path.join(right, 'results', name),
+                           shallow=False), name
+    for symbol in symbols:
+        for name in SYMBOL_OUTPUTS:
+            left_path = os.path.join(left, 'results', symbol, name)
+            right_path = os.path.join(right, 'results', symbol, name)
+            assert os.path.exists(left_path) == os.path.exists(right_path), (symbol, name)
+            if os.path.exists(left_path):
+                assert filecmp.cmp(left_path, right_path, shallow=False), (symbol, name)
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_resume_after_append_matches_full_run(tmp_path, monkeypatch, capsys, streaming):
+    history_root = tmp_path / 'history'
+    history_dir = history_root / 'a_b'
+    history_dir.mkdir(parents=True)
+    history_frame(1, 0, 600).to_csv(history_dir / 'AAA_historical.csv', index=False)
+    history_frame(2, 0, 400).to_csv(history_dir / 'BBB_historical.csv', index=False)
+    history_frame(3, 0, 300, flat=True).to_csv(history_dir / 'ZERO_historical.csv', index=False)
+
+    cached_dir, scratch_dir = tmp_path / 'cached', tmp_path / 'scratch'
+    write_config(cached_dir, history_root, streaming, cache=True)
+    write_config(scratch_dir, history_root, streaming, cache=False)
+
+    run_main(monkeypatch, cached_dir)
+    assert os.path.exists(cached_dir / 'results' / 'AAA' / 'breakout_analysis.csv')
+    assert os.path.exists(cached_dir / 'results' / 'ZERO' / '.backtest_cache.json')
+    assert not os.path.exists(cached_dir / 'results' / 'ZERO' / 'breakout_analysis.csv')
+
+    history_frame(1, 600, 150).to_csv(history_dir / 'AAA_historical.csv', mode='a', header=False, index=False)
+    capsys.readouterr()
+    run_main(monkeypatch, cached_dir)
+    output = capsys.readouterr().out
+    assert '🔁 AAA grew' in output
+    assert '⏭️ BBB unchanged' in output
+    assert '⏭️ ZERO unchanged' in output
+
+    run_main(monkeypatch, scratch_dir)
+    assert_same_results(cached_dir, scratch_dir, ['AAA', 'BBB', 'ZERO'])
+
+
+def test_unchanged_files_are_not_hashed(tmp_path, monkeypatch, capsys):
+    history_root = tmp_path / 'history'
+    history_dir = history_root / 'a_b'
+    history_dir.mkdir(parents=True)
+    history_frame(1, 0, 300).to_csv(history_dir / 'AAA_historical.csv', index=False)
+    history_frame(3, 0, 300, flat=True).to_csv(history_dir / 'ZERO_historical.csv', index=False)
+    run_dir = tmp_path / 'cached'
+    write_config(run_dir, history_root, streaming=False, cache=True)
+    run_main(monkeypatch, run_dir)
+
+    hashed = []
+    file_digests = moving_average_strategy.file_digests
+
+    def counting_digests(path, prefix_size=None):
+        hashed.append(os.path.basename(path))
+        return file_digests(path, prefix_size)
+    monkeypatch.setattr(moving_average_strategy, 'file_digests', counting_digests)
+
+    run_main(monkeypatch, run_dir)
+    assert hashed == []
+
+    # Touching a file without changing it re-hashes it once, then the new mtime is trusted
+    stat = os.stat(history_dir / 'AAA_historical.csv')
+    os.utime(history_dir / 'AAA_historical.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    capsys.readouterr()
+    run_main(monkeypatch, run_dir)
+    assert hashed == ['AAA_historical.csv']
+    assert '⏭️ AAA unchanged' in capsys.readouterr().out
+    run_main(monkeypatch, run_dir)
+    assert hashed == ['AAA_historical.csv']
@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+
+from utils.compact_live_data import compact_day, load_partition
+from utils import tick_query
+from utils.tick_query import query_ticks
+
+DAY = '2025-09-29'
+TOKEN = 12345
+
+
+def make_ticks(start, count):
+    ticks = []
+    for i in range(start, start + count):
+        ticks.append({
+            'instrument_token': TOKEN,
+            'tradingsymbol': 'NIFTY25SEP25000CE',
+            'instrument_type': 'CE',
+            'last_price': 100.0 + i,
+            'volume_traded': 1000 + i,
+            'oi': 50000,
+            'exchange_timestamp': f"{DAY}T10:{i // 60:02d}:{i % 60:02d}",
+            'depth': {
+                'buy': [{'price': 99.95 + i, 'quantity': 75, 'orders': 1}],
+                'sell': [{'price': 100.05 + i, 'quantity': 150, 'orders': 2}],
+            },
+        })
+    return ticks
+
+
+def write_live(live_root, ticks):
+    live_dir = os.path.join(live_root, DAY)
+    os.makedirs(live_dir, exist_ok=True)
+    with open(os.path.join(live_dir, 'nifty_options.json'), 'w') as f:
+        json.dump(ticks, f)
+
+
+def test_compaction_with_removal_keeps_earlier_ticks(tmp_path):
+    live_root, compact_root = str(tmp_path / 'live'), str(tmp_path / 'compact')
+
+    write_live(live_root, make_ticks(0, 20))
+    compact_day(DAY, live_root, compact_root, remove_source=True)
+    assert not os.path.exists(os.path.join(live_root, DAY, 'nifty_options.json'))
+
+    # New ticks arrive after the live JSON was removed, one overlapping a compacted timestamp
+    write_live(live_root, make_ticks(19, 6))
+    index = compact_day(DAY, live_root, compact_root, remove_source=True)
+
+    columns = load_partition(DAY, 'nifty_opt.npz', compact_root)
+    assert len(columns['instrument_token']) == 25
+    assert index['nifty_opt.npz']['rows'] == 25
+    assert np.all(np.diff(columns['exchange_timestamp'].astype(np.int64)) > 0)
+    np.testing.assert_array_equal(columns['last_price'], 100.0 + np.arange(25))
+    assert index['nifty_opt.npz']['tokens'][str(TOKEN)] == {
+        'start': 0, 'stop': 25,
+        'min_timestamp': f"{DAY}T10:00:00.000", 'max_timestamp': f"{DAY}T10:00:24.000",
+    }
+
+
+def test_query_sees_live_ticks_after_compaction(tmp_path):
+    live_root, compact_root = str(tmp_path / 'live'), str(tmp_path / 'compact')
+
+    write_live(live_root, make_ticks(0, 20))
+    compact_day(DAY, live_root, compact_root, remove_source=False)
+    # kite_ws keeps appending to the same file after a mid-day compaction
+    write_live(live_root, make_ticks(0, 25))
+
+    ticks = query_ticks(tokens=[TOKEN], days=[DAY], compact_root=compact_root, live_root=live_root)
+    np.testing.assert_array_equal(ticks['last_price'], 100.0 + np.arange(25))
+
+    window = query_ticks(tokens=[TOKEN], days=[DAY], start='10:00:18', end='10:00:23',
+                         compact_root=compact_root, live_root=live_root)
+    np.testing.assert_array_equal(window['last_price'], 100.0 + np.arange(18, 23))
+
+
+def test_query_skips_unchanged_live_json(tmp_path, monkeypatch):
+    live_root, compact_root = str(tmp_path / 'live'), str(tmp_path / 'compact')
+
+    write_live(live_root, make_ticks(0, 20))
+    compact_day(DAY, live_root, compact_root, remove_source=False)
+
+    def fail(path):
+        raise AssertionError(f"re-parsed unchanged live JSON {path}")
+    monkeypatch.setattr(tick_query, 'load_live_records', fail)
+
+    ticks = query_ticks(tokens=[TOKEN], days=[DAY], start='10:00:05', end='10:00:10',
+                        compact_root=compact_root, live_root=live_root)
+    np.testing.assert_array_equal(ticks['last_price'], 100.0 + np.arange(5, 10))
+    # Changed files outside the underlying filter are not read either
+    write_live(live_root, make_ticks(0, 25))
+    assert len(query_ticks(underlying='BANKNIFTY', days=[DAY], compact_root=compact_root,
+                           live_root=live_root)['instrument_token']) == 0
@@ -0,0 +1,35 @@
+import pytest
+
+from test_backtest_cache import assert_same_results, history_frame, run_main, write_config
+
+SYMBOLS = ['AAA', 'EMPTY', 'LATE', 'EARLY', 'FLAT']
+
+
+def write_histories(history_dir):
+    history_frame(1, 0, 700).to_csv(history_dir / 'AAA_historical.csv', index=False)
+    history_frame(2, 0, 0).to_csv(history_dir / 'EMPTY_historical.csv', index=False)
+    # Out of order only deep into the file (after the first chunk for small chunk sizes)
+    late = history_frame(3, 0, 700)
+    late.iloc[[600, 601]] = late.iloc[[601, 600]].to_numpy()
+    late.to_csv(history_dir / 'LATE_historical.csv', index=False)
+    # Out of order within the first rows
+    early = history_frame(4, 0, 500)
+    early.iloc[[3, 4]] = early.iloc[[4, 3]].to_numpy()
+    early.to_csv(history_dir / 'EARLY_historical.csv', index=False)
+    history_frame(5, 0, 300, flat=True).to_csv(history_dir / 'FLAT_historical.csv', index=False)
+
+
+@pytest.mark.parametrize('chunksize', [3, 7, 97, 1000])
+def test_streaming_matches_in_memory(tmp_path, monkeypatch, chunksize):
+    history_root = tmp_path / 'history'
+    history_dir = history_root / 'a_b'
+    history_dir.mkdir(parents=True)
+    write_histories(history_dir)
+
+    memory_dir, streaming_dir = tmp_path / 'memory', tmp_path / 'streaming'
+    write_config(memory_dir, history_root, streaming=False, cache=False, chunksize=chunksize)
+    write_config(streaming_dir, history_root, streaming=True, cache=False, chunksize=chunksize)
+
+    run_main(monkeypatch, memory_dir)
+    run_main(monkeypatch, streaming_dir)
+    assert_same_results(memory_dir, streaming_dir, SYMBOLS)
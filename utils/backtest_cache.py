@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+CACHE_FILENAME = '.backtest_cache.json'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digests(path, prefix_size=None):
+    """
+    Hash a file in a single pass.
+    Returns (size, sha256 of the whole file, sha256 of the first prefix_size bytes or None).
+    The prefix digest lets a caller tell whether a file only had rows appended since it was last hashed.
+    """
+    full = hashlib.sha256()
+    prefix_digest = None
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            if prefix_size is not None and prefix_digest is None and size + len(block) >= prefix_size:
+                split = prefix_size - size
+                full.update(block[:split])
+                prefix_digest = full.hexdigest()
+                full.update(block[split:])
+            else:
+                full.update(block)
+            size += len(block)
+    return size, full.hexdigest(), prefix_digest
+
+
+def prefix_ends_line(path, size):
+    """
+    True if the first size bytes of the file end on a line break, i.e. appended rows start on a fresh line.
+    """
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+def params_key(params, code_version):
+    """
+    Returns a stable hash of the strategy parameters and code version.
+    """
+    payload = json.dumps({'params': params, 'code_version': code_version}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def state_to_json(state):
+    """
+    Convert a stream_ema_crosses state dict to JSON-safe types.
+    """
+    out = dict(state)
+    carry = state.get('carry')
+    if carry is not None:
+        # tolist() yields Python scalars, which json round-trips without losing float precision
+        out['carry'] = {col: carry[col].tolist() for col in carry.columns}
+    out['vol_tail'] = [float(v) for v in state.get('vol_tail', [])]
+    for key in ('next_row', 'row_offset'):
+        out[key] = int(state[key])
+    if out.get('last_ema') is not None:
+        out['last_ema'] = float(out['last_ema'])
+    return out
+
+
+def state_from_json(data):
+    """
+    Inverse of state_to_json.
+    """
+    state = dict(data)
+    if state.get('carry') is not None:
+        state['carry'] = pd.DataFrame(state['carry'])
+    return state
+
+
+def load_cache_entry(symbol_dir):
+    path = os.path.join(symbol_dir, CACHE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        try:
+            return json.load(f)
+        except Exception:
+            return None
+
+
+def save_cache_entry(symbol_dir, entry):
+    # Write to a temp file and rename so an interrupted run never leaves a half-written entry
+    path = os.path.join(symbol_dir, CACHE_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
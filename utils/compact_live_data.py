@@ -0,0 +1,277 @@
+import datetime
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+LIVE_ROOT = os.path.join(BASE_DIR, 'data', 'live')
+COMPACT_ROOT = os.path.join(BASE_DIR, 'data', 'compact')
+INDEX_FILENAME = 'index.json'
+DEPTH_LEVELS = 5
+
+# Live JSON file written by kite_ws -> (underlying, instrument type) partition
+FILE_PARTITIONS = {
+    'nifty_spot.json': ('NIFTY', 'SPOT'),
+    'banknifty_spot.json': ('BANKNIFTY', 'SPOT'),
+    'india_vix.json': ('INDIAVIX', 'SPOT'),
+    'nifty_future.json': ('NIFTY', 'FUT'),
+    'banknifty_future.json': ('BANKNIFTY', 'FUT'),
+    'nifty_options.json': ('NIFTY', 'OPT'),
+    'banknifty_options.json': ('BANKNIFTY', 'OPT'),
+}
+
+# Typed columns: column name -> key in the tick dict
+FLOAT_COLUMNS = {
+    'last_price': 'last_price',
+    'average_traded_price': 'average_traded_price',
+    'change': 'change',
+    'strike': 'strike',
+}
+INT_COLUMNS = {
+    'last_traded_quantity': 'last_traded_quantity',
+    'volume': 'volume_traded',
+    'total_buy_quantity': 'total_buy_quantity',
+    'total_sell_quantity': 'total_sell_quantity',
+    'oi': 'oi',
+    'oi_day_high': 'oi_day_high',
+    'oi_day_low': 'oi_day_low',
+}
+OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+STRING_COLUMNS = ['tradingsymbol', 'instrument_type', 'expiry']
+
+_TZ_SUFFIX = re.compile(r'(Z|[+-]\d\d:?\d\d)$')
+
+
+def partition_name(underlying, instrument_type):
+    return f"{underlying.lower()}_{instrument_type.lower()}.npz"
+
+
+def source_stat(path):
+    """
+    Returns the size and mtime recorded in index.json for a compacted live JSON file, so readers
+    can tell whether it has changed since.
+    """
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def load_live_records(path):
+    """
+    Load a live JSON file as a list of tick dicts. Files written with append disabled hold a single dict.
+    """
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except Exception:
+            print(f"⚠️ Skipped {path}: invalid JSON")
+            return []
+    if isinstance(data, dict):
+        return [data]
+    return [item for item in data if isinstance(item, dict)]
+
+
+def _parse_timestamps(values):
+    """
+    Convert ISO strings (as written by deep_serialize) to datetime64[ms]; missing values become NaT.
+    """
+    cleaned = []
+    for v in values:
+        if not v:
+            cleaned.append(None)
+        else:
+            cleaned.append(_TZ_SUFFIX.sub('', str(v)))
+    return np.array(cleaned, dtype='datetime64[ms]')
+
+
+def _number(value, default):
+    return default if value is None or value == '' else value
+
+
+def _depth_arrays(records, side):
+    n = len(records)
+    price = np.full((n, DEPTH_LEVELS), np.nan)
+    qty = np.zeros((n, DEPTH_LEVELS), dtype=np.int64)
+    orders = np.zeros((n, DEPTH_LEVELS), dtype=np.int64)
+    for i, rec in enumerate(records):
+        levels = (rec.get('depth') or {}).get(side) or []
+        for j, level in enumerate(levels[:DEPTH_LEVELS]):
+            price[i, j] = _number(level.get('price'), np.nan)
+            qty[i, j] = _number(level.get('quantity'), 0)
+            orders[i, j] = _number(level.get('orders'), 0)
+    return price, qty, orders
+
+
+def records_to_columns(records):
+    """
+    Convert tick dicts to typed NumPy columns, deduplicated on (instrument_token, exchange_timestamp)
+    and sorted by the same key.
+    """
+    columns = {
+        'instrument_token': np.array([int(_number(r.get('instrument_token'), 0)) for r in records], dtype=np.int64),
+        'exchange_timestamp': _parse_timestamps([r.get('exchange_timestamp') for r in records]),
+        'last_trade_time': _parse_timestamps([r.get('last_trade_time') for r in records]),
+    }
+    for name, key in FLOAT_COLUMNS.items():
+        columns[name] = np.array([float(_number(r.get(key), np.nan)) for r in records], dtype=np.float64)
+    for name, key in INT_COLUMNS.items():
+        columns[name] = np.array([int(_number(r.get(key), 0)) for r in records], dtype=np.int64)
+    for name in OHLC_COLUMNS:
+        columns[name] = np.array([float(_number((r.get('ohlc') or {}).get(name), np.nan)) for r in records],
+                                 dtype=np.float64)
+    for name in STRING_COLUMNS:
+        columns[name] = np.array([str(_number(r.get(name), '')) for r in records], dtype=str)
+    for side, prefix in (('buy', 'bid'), ('sell', 'ask')):
+        price, qty, orders = _depth_arrays(records, side)
+        columns[f'{prefix}_price'] = price
+        columns[f'{prefix}_qty'] = qty
+        columns[f'{prefix}_orders'] = orders
+    return sort_columns(columns)
+
+
+def sort_columns(columns):
+    """
+    Sort typed columns by (instrument_token, exchange_timestamp), keeping the last of any
+    rows with the same key.
+    """
+    token = columns['instrument_token']
+    ts = columns['exchange_timestamp'].astype(np.int64)
+    # Stable sort keeps file order among equal keys, so the last occurrence is the latest write
+    order = np.lexsort((ts, token))
+    token, ts = token[order], ts[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = (token[1:] != token[:-1]) | (ts[1:] != ts[:-1])
+    order = order[keep]
+    return {name: values[order] for name, values in columns.items()}
+
+
+def merge_columns(existing, new):
+    """
+    Merge two sets of typed columns, e.g. an already compacted partition and ticks recorded
+    since. Rows in `new` win over rows in `existing` with the same token and timestamp.
+    """
+    names = [name for name in existing if name in new]
+    return sort_columns({name: np.concatenate([existing[name], new[name]]) for name in names})
+
+
+def build_partition_index(columns):
+    """
+    Returns the min/max timestamp index for a sorted partition, with per-token row ranges.
+    """
+    token = columns['instrument_token']
+    ts = columns['exchange_timestamp']
+    valid = ts[~np.isnat(ts)]
+    starts = np.flatnonzero(np.r_[True, token[1:] != token[:-1]]) if len(token) else np.array([], dtype=int)
+    stops = np.r_[starts[1:], len(token)]
+    tokens = {}
+    for start, stop in zip(starts, stops):
+        token_ts = ts[start:stop]
+        token_ts = token_ts[~np.isnat(token_ts)]
+        tokens[str(int(token[start]))] = {
+            'start': int(start),
+            'stop': int(stop),
+            'min_timestamp': str(token_ts.min()) if len(token_ts) else None,
+            'max_timestamp': str(token_ts.max()) if len(token_ts) else None,
+        }
+    return {
+        'rows': int(len(token)),
+        'min_timestamp': str(valid.min()) if len(valid) else None,
+        'max_timestamp': str(valid.max()) if len(valid) else None,
+        'tokens': tokens,
+    }
+
+
+def write_partition(path, columns):
+    # np.savez_compressed appends .npz to names without it, so write to a *.tmp.npz and rename
+    tmp_path = path[:-len('.npz')] + '.tmp.npz'
+    np.savez_compressed(tmp_path, **columns)
+    os.replace(tmp_path, path)
+
+
+def compact_day(day, live_root=LIVE_ROOT, compact_root=COMPACT_ROOT, remove_source=False):
+    """
+    Compact data/live/<day>/ into compressed, typed, sorted partitions under data/compact/<day>/,
+    one per underlying and instrument type, plus an index.json of per-partition timestamp ranges.
+    Returns the index dict.
+    """
+    live_dir = os.path.join(live_root, day)
+    out_dir = os.path.join(compact_root, day)
+    if not os.path.isdir(live_dir):
+        print(f"⚠️ No live data for {day} at {live_dir}")
+        return {}
+    os.makedirs(out_dir, exist_ok=True)
+
+    grouped = {}
+    sources = []
+    source_stats = {}
+    for filename in sorted(os.listdir(live_dir)):
+        if not filename.endswith('.json'):
+            continue
+        partition = FILE_PARTITIONS.get(filename)
+        if partition is None:
+            print(f"⚠️ Skipped {filename}: no partition mapping")
+            continue
+        path = os.path.join(live_dir, filename)
+        # Stat before reading: a write landing in between then shows up as a changed file
+        source_stats.setdefault(partition, {})[filename] = source_stat(path)
+        grouped.setdefault(partition, []).extend(load_live_records(path))
+        sources.append(path)
+
+    index_path = os.path.join(out_dir, INDEX_FILENAME)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+    compact_bytes = 0
+    for (underlying, instrument_type), records in grouped.items():
+        if not records:
+            continue
+        columns = records_to_columns(records)
+        name = partition_name(underlying, instrument_type)
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            # Keep ticks from earlier compactions whose live JSON has since been removed
+            columns = merge_columns(load_partition(day, name, compact_root), columns)
+        write_partition(path, columns)
+        entry = build_partition_index(columns)
+        entry.update({'underlying': underlying, 'instrument_type': instrument_type,
+                      'sources': source_stats[(underlying, instrument_type)]})
+        index[name] = entry
+        compact_bytes += os.path.getsize(path)
+        print(f"✅ Compacted {len(records)} tick(s) into {name} ({entry['rows']} unique)")
+    source_bytes = sum(os.path.getsize(p) for p in sources)
+
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(index_path + '.tmp', index_path)
+
+    if compact_bytes:
+        print(f"📦 {day}: {source_bytes} bytes of JSON -> {compact_bytes} bytes compacted "
+              f"({source_bytes / compact_bytes:.1f}x)")
+    if remove_source and compact_bytes:
+        for path in sources:
+            os.remove(path)
+        print(f"🗑️ Removed {len(sources)} live JSON file(s) for {day}")
+    return index
+
+
+def load_partition(day, name, compact_root=COMPACT_ROOT):
+    """
+    Load a compacted partition as a dict of NumPy arrays.
+    """
+    with np.load(os.path.join(compact_root, day, name)) as data:
+        return {key: data[key] for key in data.files}
+
+
+def main():
+    from config_loader import config
+
+    day = sys.argv[1] if len(sys.argv) > 1 else datetime.date.today().isoformat()
+    remove_source = config.getboolean("storage", "remove_live_after_compaction", fallback=False)
+    compact_day(day, remove_source=remove_source)
+
+
+if __name__ == "__main__":
+    main()
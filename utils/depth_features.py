@@ -0,0 +1,177 @@
+import time
+
+import numpy as np
+
+DEPTH_LEVELS = 5
+FEATURES = (
+    'spread',          # best ask - best bid
+    'mid',             # (best ask + best bid) / 2
+    'weighted_mid',    # best bid/ask weighted by the opposite side's quantity (microprice)
+    'imbalance_l1',    # (bid qty - ask qty) / (bid qty + ask qty) at the top level
+    'imbalance',       # same over all five levels
+    'bid_depth_rate',  # change in total bid quantity per second since the token's previous tick (NaN if none elapsed)
+    'ask_depth_rate',  # change in total ask quantity per second
+    'ofi',             # top-of-book order flow imbalance since the previous tick
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURES)}
+
+
+def decode_depth(ticks, out=None):
+    """
+    Decode the 5-level depth of a batch of full-mode ticks into fixed-shape arrays
+    bid_price/bid_qty/ask_price/ask_qty of shape (len(ticks), 5). Missing levels, including the
+    all-zero levels Kite sends for an empty side of the book, are NaN price, 0 quantity.
+    out may be a dict of preallocated arrays with at least len(ticks) rows, reused across batches.
+    """
+    n = len(ticks)
+    if out is None or len(out['bid_price']) < n:
+        out = {
+            'bid_price': np.empty((n, DEPTH_LEVELS)),
+            'bid_qty': np.empty((n, DEPTH_LEVELS)),
+            'ask_price': np.empty((n, DEPTH_LEVELS)),
+            'ask_qty': np.empty((n, DEPTH_LEVELS)),
+        }
+    bid_price, bid_qty = out['bid_price'][:n], out['bid_qty'][:n]
+    ask_price, ask_qty = out['ask_price'][:n], out['ask_qty'][:n]
+    bid_price.fill(np.nan)
+    ask_price.fill(np.nan)
+    bid_qty.fill(0)
+    ask_qty.fill(0)
+    for i, tick in enumerate(ticks):
+        depth = tick.get('depth')
+        if not depth:
+            continue
+        for prices, qtys, levels in ((bid_price, bid_qty, depth.get('buy')), (ask_price, ask_qty, depth.get('sell'))):
+            for j, level in enumerate((levels or ())[:DEPTH_LEVELS]):
+                if not level['quantity']:
+                    continue
+                prices[i, j] = level['price']
+                qtys[i, j] = level['quantity']
+    return bid_price, bid_qty, ask_price, ask_qty
+
+
+class DepthFeatureTracker:
+    """
+    Streaming market-depth features per instrument token.
+    Each batch of ticks is decoded once into fixed-shape arrays and the features computed
+    vectorised across the batch; the last `window` feature rows per token are kept in a
+    preallocated ring buffer. Register update() as a kite_ws tick listener.
+    """
+
+    def __init__(self, window=256, capacity=64):
+        self.window = window
+        self.slots = {}
+        self._allocate(capacity)
+        self._scratch = None
+
+    def _allocate(self, capacity):
+        old = getattr(self, 'features', None)
+        features = np.full((capacity, self.window, len(FEATURES)), np.nan)
+        times = np.zeros((capacity, self.window))
+        counts = np.zeros(capacity, dtype=np.int64)
+        # Previous top-of-book and total depth per token, for the change-based features
+        prev = np.full((capacity, 6), np.nan)  # bid px, bid qty, ask px, ask qty, total bid, total ask
+        prev_time = np.full(capacity, np.nan)
+        if old is not None:
+            used = len(self.slots)
+            features[:used] = self.features[:used]
+            times[:used] = self.times[:used]
+            counts[:used] = self.counts[:used]
+            prev[:used] = self.prev[:used]
+            prev_time[:used] = self.prev_time[:used]
+        self.features, self.times, self.counts, self.prev, self.prev_time = features, times, counts, prev, prev_time
+
+    def _slot(self, token):
+        slot = self.slots.get(token)
+        if slot is None:
+            slot = len(self.slots)
+            if slot >= len(self.counts):
+                self._allocate(2 * len(self.counts))
+            self.slots[token] = slot
+        return slot
+
+    def update(self, ticks, now=None):
+        """
+        Add a batch of ticks. Ticks without depth (index ticks, quote mode) are ignored.
+        now is the receipt time in seconds used for the rate features (defaults to time.time()).
+        """
+        ticks = [t for t in ticks if t.get('depth')]
+        if not ticks:
+            return
+        now = time.time() if now is None else now
+        bid_px, bid_q, ask_px, ask_q = decode_depth(ticks, self._scratch)
+        if self._scratch is None or len(self._scratch['bid_price']) < len(ticks):
+            self._scratch = {'bid_price': bid_px, 'bid_qty': bid_q, 'ask_price': ask_px, 'ask_qty': ask_q}
+
+        slots = np.array([self._slot(t['instrument_token']) for t in ticks], dtype=np.int64)
+        if len(set(slots.tolist())) == len(slots):
+            self._apply(slots, bid_px, bid_q, ask_px, ask_q, now)
+            return
+        # A token seen twice in one batch must be applied in order, so process in rounds of unique slots
+        seen = {}
+        rounds = np.empty(len(slots), dtype=np.int64)
+        for i, slot in enumerate(slots.tolist()):
+            rounds[i] = seen.get(slot, 0)
+            seen[slot] = rounds[i] + 1
+        for r in range(rounds.max() + 1):
+            rows = np.flatnonzero(rounds == r)
+            self._apply(slots[rows], bid_px[rows], bid_q[rows], ask_px[rows], ask_q[rows], now)
+
+    def _apply(self, slots, bid_px, bid_q, ask_px, ask_q, now):
+        b1, bq1, a1, aq1 = bid_px[:, 0], bid_q[:, 0], ask_px[:, 0], ask_q[:, 0]
+        total_bid, total_ask = bid_q.sum(axis=1), ask_q.sum(axis=1)
+        prev = self.prev[slots]
+        pb1, pbq1, pa1, paq1, ptotal_bid, ptotal_ask = prev.T
+        dt = now - self.prev_time[slots]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.empty((len(slots), len(FEATURES)))
+            out[:, 0] = a1 - b1
+            out[:, 1] = (a1 + b1) / 2
+            out[:, 2] = (b1 * aq1 + a1 * bq1) / (bq1 + aq1)
+            out[:, 3] = (bq1 - aq1) / (bq1 + aq1)
+            out[:, 4] = (total_bid - total_ask) / (total_bid + total_ask)
+            rate_ok = dt > 0
+            out[:, 5] = np.where(rate_ok, (total_bid - ptotal_bid) / dt, np.nan)
+            out[:, 6] = np.where(rate_ok, (total_ask - ptotal_ask) / dt, np.nan)
+            # Cont-Kukanov-Stoikov order flow imbalance at the best bid/ask
+            out[:, 7] = (np.where(b1 >= pb1, bq1, 0) - np.where(b1 <= pb1, pbq1, 0)
+                         - np.where(a1 <= pa1, aq1, 0) + np.where(a1 >= pa1, paq1, 0))
+            out[np.isnan(pb1), 7] = np.nan
+
+        pos = self.counts[slots] % self.window
+        self.features[slots, pos] = out
+        self.times[slots, pos] = now
+        self.counts[slots] += 1
+        self.prev[slots] = np.column_stack([b1, bq1, a1, aq1, total_bid, total_ask])
+        self.prev_time[slots] = now
+
+    def latest(self, token):
+        """
+        Returns {feature: value} for the token's most recent tick, or None if not seen.
+        """
+        slot = self.slots.get(token)
+        if slot is None or not self.counts[slot]:
+            return None
+        row = self.features[slot, (self.counts[slot] - 1) % self.window]
+        return {name: float(row[i]) for i, name in enumerate(FEATURES)}
+
+    def history(self, token, feature=None):
+        """
+        Returns (times, values) for the token's rolling window, oldest first. values has one
+        column per entry of FEATURES, or is 1-D when a feature name is given.
+        """
+        slot = self.slots.get(token)
+        if slot is None:
+            return np.empty(0), np.empty(0 if feature is not None else (0, len(FEATURES)))
+        count = int(self.counts[slot])
+        n = min(count, self.window)
+        order = (np.arange(count - n, count)) % self.window
+        values = self.features[slot, order]
+        if feature is not None:
+            values = values[:, FEATURE_INDEX[feature]]
+        return self.times[slot, order], values
+
+    def rolling_mean(self, token, feature):
+        _, values = self.history(token, feature)
+        return float(np.nanmean(values)) if len(values) and not np.isnan(values).all() else None
@@ -2,33 +2,17 @@ import configparser
 import datetime
 import os
 
-from instrument_utils import get_instrument_token, get_all_instruments
+from instrument_utils import get_all_instruments, load_index_symbols, resolve_symbols, resolve_universe
 from kiteconnect import KiteConnect
 from nsetools import Nse
 import pandas as pd
 
 from utils.config_loader import config
+from utils.profiling import profiled_job, profiler
 
 
 def get_symbols_from_index(index_name):
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    index_map = {
-        "nifty 50": os.path.join(base_dir, "..", "resources", "nifty_50.csv"),
-        "nifty 100": os.path.join(base_dir, "..", "resources", "nifty_100.csv"),
-        "nifty 200": os.path.join(base_dir, "..", "resources", "nifty_200.csv"),
-        "nifty 500": os.path.join(base_dir, "..", "resources", "nifty_500.csv")
-    }
-    path = index_map.get(index_name.lower())
-    print("Path:", path)
-    print("Exists:", os.path.exists(path))
-    print("Absolute path:", os.path.abspath(path))
-    print("Directory listing:", os.listdir(os.path.dirname(path)))
-    if path and os.path.exists(path):
-        df = pd.read_csv(path)  # Remove delimiter for auto-detection
-        print("Columns in CSV:", df.columns.tolist())
-        # Adjust the column name below if needed
-        return df["Symbol"].dropna().tolist()
-    return []
+    return load_index_symbols(index_name)
 
 def fetch_data(symbol, token, kite, start_date, end_date, interval, continuous):
     data = kite.historical_data(
@@ -53,25 +37,32 @@ def fetch_in_batches(symbol, token, kite, from_date, to_date, interval, continuo
         return pd.concat(results, ignore_index=True)
     return pd.DataFrame()
 
-def fetch_historical_data(symbols, exchange, instrument_type, kite, instruments_df, from_date, to_date, interval, continuous=False):
+def fetch_historical_data(symbols, exchange, instrument_type, kite, instruments_df, from_date, to_date, interval, continuous=False,
+                          token_table=None):
     from_date_dt = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
     to_date_dt = datetime.datetime.strptime(to_date, "%Y-%m-%d").date()
     # Use absolute output directory
     output_dir = os.path.join("/Users/CHIDASX1/Downloads/kite_dashboard/data/history", f"{from_date}_{to_date}")
     os.makedirs(output_dir, exist_ok=True)
-    for symbol in symbols:
-        token = get_instrument_token(symbol, instrument_type=instrument_type)
-        if token:
+    # Resolve every symbol in one join against the instruments master, unless already resolved
+    if token_table is None:
+        with profiler.stage('symbol_resolution'):
+            token_table, unresolved = resolve_symbols(symbols, exchange, instrument_type, instruments_df)
+        for symbol in unresolved:
+            print(f"⚠️ Instrument token not found for {symbol} in {exchange}")
+    for symbol, token in zip(token_table['symbol'], token_table['instrument_token']):
+        with profiler.symbol(symbol):
             try:
-                df = fetch_in_batches(symbol, token, kite, from_date_dt, to_date_dt, interval, continuous)
+                with profiler.stage('fetch'):
+                    df = fetch_in_batches(symbol, int(token), kite, from_date_dt, to_date_dt, interval, continuous)
                 out_path = os.path.join(output_dir, f"{symbol}_historical.csv")
-                df.to_csv(out_path, index=False)
+                with profiler.stage('csv_write'):
+                    df.to_csv(out_path, index=False)
                 print(f"✅ Saved historical data for {symbol} to {out_path}")
             except Exception as e:
                 print(f"❌ Failed to fetch data for {symbol}: {e}")
-        else:
-            print(f"⚠️ Instrument token not found for {symbol} in {exchange}")
 
+@profiled_job('fetch_historical_data')
 def main():
 
     # Zerodha credentials
@@ -86,15 +77,24 @@ def main():
     # Get equity symbols from NSE index
     nse_index = config.get("equities","nse_index")
 
-    equity_symbols = get_symbols_from_index(nse_index)
+    with profiler.stage('symbol_resolution'):
+        equity_symbols = get_symbols_from_index(nse_index)
     print("Equity symbols:", equity_symbols)
     futures_symbols = [s.strip() for s in config["futures"]["symbols"].split(",")]
 
     kite = KiteConnect(api_key=api_key)
     kite.set_access_token(access_token)
 
-    instruments_df = get_all_instruments()
-    fetch_historical_data(equity_symbols, "NSE", "EQ", kite, instruments_df, from_date, to_date, interval)
+    with profiler.stage('symbol_resolution'):
+        instruments_df = get_all_instruments()
+        # Build the whole work list in one pass (cached per trading day)
+        token_table, unresolved = resolve_universe(symbols=equity_symbols, futures=futures_symbols,
+                                                   instruments_df=instruments_df)
+    for symbol, instrument_type in unresolved:
+        print(f"⚠️ Instrument token not found for {symbol} ({instrument_type})")
+    equity_tokens = token_table[token_table['instrument_type'] == "EQ"]
+    fetch_historical_data(equity_symbols, "NSE", "EQ", kite, instruments_df, from_date, to_date, interval,
+                          token_table=equity_tokens)
     # fetch_historical_data(futures_symbols, "NFO", "FUT", kite, instruments_df, from_date, to_date, interval,
     #                       continuous=True)
 
@@ -1,3 +1,6 @@
+import datetime
+import functools
+import hashlib
 import json
 import os
 import requests
@@ -5,6 +8,15 @@ import pandas as pd
 
 ZERODHA_INSTRUMENTS_URL = "https://api.kite.trade/instruments"
 INSTRUMENTS_CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "resources", "zerodha_instruments.csv")
+RESOURCES_DIR = os.path.dirname(INSTRUMENTS_CSV_PATH)
+UNIVERSE_CACHE_DIR = os.path.join(RESOURCES_DIR, "universe_tokens")
+INDEX_CONSTITUENT_FILES = {
+    "nifty 50": "nifty_50.csv",
+    "nifty 100": "nifty_100.csv",
+    "nifty 200": "nifty_200.csv",
+    "nifty 500": "nifty_500.csv",
+}
+TOKEN_TABLE_COLUMNS = ['symbol', 'instrument_type', 'exchange', 'tradingsymbol', 'instrument_token', 'expiry']
 
 
 def download_instruments_csv(force=False):
@@ -170,3 +182,111 @@ def write_instruments_to_json(df, tokens, filename):
     with open(filename, "w") as f:
         json.dump(data, f, indent=2)
     print(f"Wrote {len(data)} instruments to {filename}")
+
+
+@functools.lru_cache(maxsize=None)
+def _read_index_symbols(path, mtime):
+    # mtime is part of the cache key so an updated constituent file is re-read
+    df = pd.read_csv(path)
+    return tuple(df["Symbol"].dropna().tolist())
+
+
+def load_index_symbols(index_name):
+    """
+    Returns the constituent symbols of an index ('nifty 50', 'nifty 100', ...) from resources/,
+    reading each constituent CSV once per process.
+    """
+    filename = INDEX_CONSTITUENT_FILES.get(index_name.lower())
+    path = os.path.join(RESOURCES_DIR, filename) if filename else None
+    if not path or not os.path.exists(path):
+        print(f"⚠️ No constituent file for index '{index_name}'")
+        return []
+    return list(_read_index_symbols(path, os.path.getmtime(path)))
+
+
+def resolve_symbols(symbols, exchange="NSE", instrument_type="EQ", instruments_df=None):
+    """
+    Resolve many symbols to instrument tokens with one join against the instruments master.
+    EQ symbols match tradingsymbol exactly within the exchange. FUT symbols match a full
+    futures tradingsymbol (e.g. 'INFY24OCTFUT') or, failing that, an underlying root
+    (e.g. 'INFY'), which resolves to its nearest expiry.
+    Returns (token_table, unresolved) where token_table has TOKEN_TABLE_COLUMNS in input order.
+    """
+    df = get_all_instruments() if instruments_df is None else instruments_df
+    wanted = pd.DataFrame({'symbol': list(dict.fromkeys(symbols))})
+    if instrument_type == "EQ":
+        # Hash-based isin narrows the master to candidate rows before any string comparisons
+        master = df[df['tradingsymbol'].isin(wanted['symbol'])]
+        master = master[(master['segment'] == exchange) & (master['instrument_type'] == "EQ")]
+        lookup = master.drop_duplicates('tradingsymbol').set_index('tradingsymbol', drop=False)
+    elif instrument_type == "FUT":
+        master = df[df['tradingsymbol'].isin(wanted['symbol']) | df['name'].isin(wanted['symbol'])]
+        master = master[master['segment'] == "NFO-FUT"].sort_values('expiry', kind='stable')
+        # Full tradingsymbols first, then underlying roots mapped to their nearest expiry
+        by_symbol = master.drop_duplicates('tradingsymbol').set_index('tradingsymbol', drop=False)
+        by_root = master.drop_duplicates('name').set_index('name', drop=False)
+        lookup = pd.concat([by_symbol, by_root[~by_root.index.isin(by_symbol.index)]])
+    else:
+        raise ValueError(f"Unsupported instrument_type for batch resolution: {instrument_type}")
+    table = wanted.merge(lookup, how='left', left_on='symbol', right_index=True)
+
+    resolved = table['instrument_token'].notna()
+    unresolved = table.loc[~resolved, 'symbol'].tolist()
+    table = table[resolved].assign(instrument_type=instrument_type, exchange=exchange)
+    table['instrument_token'] = table['instrument_token'].astype('int64')
+    if 'expiry' not in table.columns:
+        table['expiry'] = None
+    return table[TOKEN_TABLE_COLUMNS].reset_index(drop=True), unresolved
+
+
+def _universe_cache_path(trading_day):
+    return os.path.join(UNIVERSE_CACHE_DIR, f"{trading_day}.json")
+
+
+def resolve_universe(index_name=None, symbols=None, futures=None, exchange="NSE", instruments_df=None,
+                     use_cache=True, trading_day=None):
+    """
+    Resolve a whole universe in one pass: an index's constituents and/or explicit equity symbols
+    on `exchange`, plus futures (full tradingsymbols or underlying roots) on NFO.
+    Results are cached per trading day (and instruments file version) under resources/universe_tokens/,
+    so repeat calls on the same day skip the instruments master entirely.
+    Returns (token_table, unresolved) where unresolved is a list of (symbol, instrument_type).
+    """
+    trading_day = trading_day or datetime.date.today().isoformat()
+    equities = (load_index_symbols(index_name) if index_name else []) + list(symbols or [])
+    futures = list(futures or [])
+    master_version = os.path.getmtime(INSTRUMENTS_CSV_PATH) if os.path.exists(INSTRUMENTS_CSV_PATH) else None
+    spec = json.dumps({'equities': equities, 'futures': futures, 'exchange': exchange, 'master': master_version})
+    key = hashlib.sha256(spec.encode()).hexdigest()
+
+    cache_path = _universe_cache_path(trading_day)
+    cache = {}
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            try:
+                cache = json.load(f)
+            except json.JSONDecodeError:
+                cache = {}
+        if key in cache:
+            entry = cache[key]
+            table = pd.DataFrame(entry['table'], columns=TOKEN_TABLE_COLUMNS)
+            return table, [tuple(u) for u in entry['unresolved']]
+
+    df = get_all_instruments() if instruments_df is None else instruments_df
+    tables, unresolved = [], []
+    for names, seg_exchange, instrument_type in ((equities, exchange, "EQ"), (futures, "NFO", "FUT")):
+        if names:
+            table, missing = resolve_symbols(names, seg_exchange, instrument_type, df)
+            tables.append(table)
+            unresolved.extend((symbol, instrument_type) for symbol in missing)
+    table = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=TOKEN_TABLE_COLUMNS)
+
+    if use_cache:
+        os.makedirs(UNIVERSE_CACHE_DIR, exist_ok=True)
+        cache[key] = {
+            'table': json.loads(table.to_json(orient='records')),
+            'unresolved': unresolved,
+        }
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+    return table, unresolved
@@ -5,6 +5,7 @@ import json
 from kiteconnect import KiteTicker
 
 from .config_loader import config
+from .depth_features import DepthFeatureTracker
 from .instrument_utils import (
     get_all_instruments,
     get_nifty_banknifty_tokens,
@@ -37,6 +38,23 @@ tokens_dict = get_nifty_banknifty_tokens()
 
 nifty_opts = {}
 bn_opts = {}
+
+# In-process tick subscribers (e.g. the strategy engine), called with each raw tick batch
+tick_listeners = []
+
+
+def add_tick_listener(listener):
+    """
+    Register listener(ticks) to receive every tick batch in-process, before it is enriched and written to JSON.
+    """
+    tick_listeners.append(listener)
+
+
+# Rolling order-book features for every full-mode subscription, updated at tick rate
+depth_features = DepthFeatureTracker()
+add_tick_listener(depth_features.update)
+
+
 def deep_serialize(obj):
     """
     Recursively convert all datetime/date objects in a dict/list to ISO strings for JSON.
@@ -104,6 +122,11 @@ def write_json(filename, data):
 
 def on_ticks(ws, ticks):
     global nifty_opts, bn_opts
+    for listener in tick_listeners:
+        try:
+            listener(ticks)
+        except Exception as e:
+            print(f"⚠️ Tick listener {getattr(listener, '__name__', listener)} failed: {e}")
     print("✅ Received Ticks:")
     for tick in ticks:
         token = tick['instrument_token']
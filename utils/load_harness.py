@@ -0,0 +1,402 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import queue
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+DEPTH_LEVELS = 5
+SYNTHETIC_TOKEN_BASE = 90000000
+# underlying -> (starting spot, strike step, spot token key in kite_ws.tokens_dict)
+UNDERLYINGS = {
+    'NIFTY': (25000.0, 50, 'NIFTY_SPOT'),
+    'BANKNIFTY': (55000.0, 100, 'BANKNIFTY_SPOT'),
+}
+
+
+class FakeSocket:
+    """
+    Stand-in for KiteTicker passed to on_ticks; records subscriptions instead of sending them.
+    """
+
+    def __init__(self):
+        self.subscribed = set()
+        self.modes = {}
+
+    def subscribe(self, tokens):
+        self.subscribed.update(tokens)
+
+    def set_mode(self, mode, tokens):
+        for token in tokens:
+            self.modes[token] = mode
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (1µs to 100s), so multi-hour runs keep percentiles in constant memory.
+    """
+
+    def __init__(self, buckets=2000):
+        self.edges = np.logspace(-6, 2, buckets)
+        self.counts = np.zeros(buckets + 1, dtype=np.int64)
+
+    def add(self, seconds):
+        self.counts[np.searchsorted(self.edges, seconds)] += 1
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def percentile(self, pct):
+        total = self.counts.sum()
+        if not total:
+            return None
+        idx = int(np.searchsorted(np.cumsum(self.counts), total * pct / 100.0))
+        return float(self.edges[min(idx, len(self.edges) - 1)])
+
+    def summary(self):
+        return {f"p{name}_ms": (None if v is None else v * 1e3) for name, v in
+                (('50', self.percentile(50)), ('99', self.percentile(99)), ('999', self.percentile(99.9)))}
+
+
+def rss_bytes():
+    """
+    Current resident set size; falls back to peak RSS where /proc is unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def process_write_bytes():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def build_universe(n_tokens, instruments_df=None, spot_tokens=None):
+    """
+    Returns a list of (token, underlying, strike, option_type) for the load universe; option_type
+    is None for the spot index. Uses the instruments master's NIFTY/BANKNIFTY options nearest
+    to expiry when available so downstream lookups hit real rows, padding with synthetic tokens.
+    """
+    spot_tokens = spot_tokens or {}
+    universe = [(spot_tokens.get(key, SYNTHETIC_TOKEN_BASE + i), name, None, None)
+                for i, (name, (_, _, key)) in enumerate(UNDERLYINGS.items())]
+    per_underlying = max((n_tokens - len(universe)) // len(UNDERLYINGS), 1)
+    next_synthetic = SYNTHETIC_TOKEN_BASE + len(universe)
+    for name, (spot, step, _) in UNDERLYINGS.items():
+        rows = []
+        if instruments_df is not None:
+            opts = instruments_df[(instruments_df['name'] == name) & (instruments_df['segment'] == 'NFO-OPT')]
+            if not opts.empty:
+                opts = opts.assign(dist=(opts['strike'] - spot).abs()).sort_values(['expiry', 'dist'])
+                rows = [(int(r.instrument_token), name, float(r.strike), r.instrument_type)
+                        for r in opts.head(per_underlying).itertuples()]
+        strike_offset = 0
+        while len(rows) < per_underlying:
+            for opt_type in ('CE', 'PE'):
+                strike = spot + (strike_offset // 2 + 1) * step * (1 if strike_offset % 2 else -1)
+                rows.append((next_synthetic, name, strike, opt_type))
+                next_synthetic += 1
+            strike_offset += 1
+        universe.extend(rows[:per_underlying])
+    return universe
+
+
+class TickGenerator:
+    """
+    Builds KiteTicker full-mode tick dicts. Each underlying's spot follows a random walk and
+    option prices follow it through intrinsic value plus a time value that decays away from ATM.
+    """
+
+    def __init__(self, universe, seed=0, vol_per_tick=0.0002):
+        self.rng = np.random.default_rng(seed)
+        self.universe = universe
+        self.tokens = np.array([u[0] for u in universe], dtype=np.int64)
+        self.underlying_idx = np.array([list(UNDERLYINGS).index(u[1]) for u in universe])
+        self.strike = np.array([u[2] or 0.0 for u in universe])
+        self.is_call = np.array([u[3] == 'CE' for u in universe])
+        self.is_option = np.array([u[3] is not None for u in universe])
+        self.spot = np.array([v[0] for v in UNDERLYINGS.values()])
+        self.step = np.array([v[1] for v in UNDERLYINGS.values()], dtype=float)
+        self.day_open = self.spot.copy()
+        self.volume = np.zeros(len(universe), dtype=np.int64)
+        self.oi = self.rng.integers(10000, 500000, len(universe))
+        self.vol_per_tick = vol_per_tick
+
+    def prices(self, idx):
+        self.spot *= np.exp(self.rng.normal(0, self.vol_per_tick, len(self.spot)))
+        spot = self.spot[self.underlying_idx[idx]]
+        strike = self.strike[idx]
+        intrinsic = np.where(self.is_call[idx], spot - strike, strike - spot).clip(min=0)
+        width = 4 * self.step[self.underlying_idx[idx]]
+        time_value = 0.006 * spot * np.exp(-np.abs(spot - strike) / width)
+        option_price = np.round((intrinsic + time_value) / 0.05) * 0.05
+        return np.where(self.is_option[idx], np.maximum(option_price, 0.05), np.round(spot, 2))
+
+    def batch(self, size, now=None):
+        now = now or datetime.datetime.now().replace(microsecond=0)
+        idx = self.rng.choice(len(self.tokens), size=min(size, len(self.tokens)), replace=False)
+        price_arr = self.prices(idx)
+        price = price_arr.tolist()
+        qty = self.rng.integers(1, 40, (len(idx), 2, DEPTH_LEVELS)) * 25
+        traded = self.rng.integers(0, 20, len(idx)) * 25
+        self.volume[idx] += traded
+        self.oi[idx] += self.rng.integers(-500, 600, len(idx))
+        levels = np.arange(1, DEPTH_LEVELS + 1) * 0.05
+        bid_px = np.round(price_arr[:, None] - levels, 2)
+        ask_px = np.round(price_arr[:, None] + levels, 2).tolist()
+        orders = 1 + qty // 100
+        # Bids can't go below one tick; like the exchange, send those levels empty (all zeros)
+        empty_bid = bid_px < 0.05
+        bid_px[empty_bid] = 0.0
+        qty[:, 0][empty_bid] = 0
+        orders[:, 0][empty_bid] = 0
+        bid_px = bid_px.tolist()
+        orders = orders.tolist()
+        qty = qty.tolist()
+        ticks = []
+        for k, i in enumerate(idx.tolist()):
+            ltp = price[k]
+            underlying = self.underlying_idx[i]
+            if not self.is_option[i]:
+                ticks.append({
+                    'tradable': False, 'mode': 'full', 'instrument_token': int(self.tokens[i]), 'last_price': ltp,
+                    'ohlc': {'open': float(self.day_open[underlying]), 'high': ltp, 'low': ltp,
+                             'close': float(self.day_open[underlying])},
+                    'change': 0.0, 'exchange_timestamp': now,
+                })
+                continue
+            bids, asks = qty[k]
+            ticks.append({
+                'tradable': True, 'mode': 'full', 'instrument_token': int(self.tokens[i]), 'last_price': ltp,
+                'last_traded_quantity': int(traded[k]), 'average_traded_price': ltp,
+                'volume_traded': int(self.volume[i]), 'total_buy_quantity': sum(bids) * 40,
+                'total_sell_quantity': sum(asks) * 40,
+                'ohlc': {'open': ltp, 'high': ltp, 'low': ltp, 'close': ltp}, 'change': 0.0,
+                'last_trade_time': now, 'oi': int(self.oi[i]), 'oi_day_high': int(self.oi[i]),
+                'oi_day_low': int(self.oi[i]), 'exchange_timestamp': now,
+                'depth': {
+                    'buy': [{'quantity': q, 'price': p, 'orders': o} for q, p, o in zip(bids, bid_px[k], orders[k][0])],
+                    'sell': [{'quantity': q, 'price': p, 'orders': o} for q, p, o in zip(asks, ask_px[k], orders[k][1])],
+                },
+            })
+        return ticks
+
+
+def run_load(callback, universe, rate, duration, batches_per_sec=10, sample_interval=5.0, output_dir=None,
+             max_queue=10000, seed=0, on_sample=None):
+    """
+    Drive callback(ws, ticks) with generated tick batches at `rate` ticks/s for `duration` seconds.
+    A producer thread enqueues batches on a fixed schedule (as the socket thread would) and the
+    caller's thread consumes them, so a slow callback shows up as queue growth and end-to-end latency.
+    Returns a report dict with throughput, latency percentiles, queue depth, RSS and disk writes over time.
+    """
+    generator = TickGenerator(universe, seed=seed)
+    ws = FakeSocket()
+    # A batch carries each token at most once, so high rates over few tokens need more batches per second
+    batches_per_sec = max(batches_per_sec, int(np.ceil(rate / len(universe))))
+    batch_size = max(int(round(rate / batches_per_sec)), 1)
+    batches = queue.Queue(maxsize=max_queue)
+    stop = threading.Event()
+    produced = {'batches': 0, 'ticks': 0, 'dropped': 0, 'behind': 0}
+
+    def produce():
+        period = 1.0 / batches_per_sec
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            ticks = generator.batch(batch_size)
+            try:
+                batches.put_nowait((time.perf_counter(), ticks))
+                produced['batches'] += 1
+                produced['ticks'] += len(ticks)
+            except queue.Full:
+                produced['dropped'] += len(ticks)
+            next_at += period
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                produced['behind'] += 1  # generator itself cannot sustain the offered rate
+
+    callback_hist, e2e_hist = LatencyHistogram(), LatencyHistogram()
+    interval_hist = LatencyHistogram()
+    samples = []
+    consumed = 0
+    write_start = process_write_bytes()
+    start = time.perf_counter()
+    last_sample, last_consumed = start, 0
+    producer = threading.Thread(target=produce, name='tick-producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            try:
+                enqueued, ticks = batches.get(timeout=0.1)
+            except queue.Empty:
+                enqueued = None
+            if enqueued is not None:
+                began = time.perf_counter()
+                callback(ws, ticks)
+                done = time.perf_counter()
+                callback_hist.add(done - began)
+                interval_hist.add(done - began)
+                e2e_hist.add(done - enqueued)
+                consumed += len(ticks)
+            now = time.perf_counter()
+            if now - last_sample >= sample_interval:
+                writes = process_write_bytes()
+                sample = {
+                    'elapsed_s': round(now - start, 3),
+                    'ticks_per_s': (consumed - last_consumed) / (now - last_sample),
+                    'queue_batches': batches.qsize(),
+                    'rss_mb': rss_bytes() / 2 ** 20,
+                    'written_mb': None if writes is None else (writes - write_start) / 2 ** 20,
+                    'disk_mb': None if output_dir is None else dir_bytes(output_dir) / 2 ** 20,
+                    **interval_hist.summary(),
+                }
+                samples.append(sample)
+                if on_sample:
+                    on_sample(sample)
+                interval_hist = LatencyHistogram()
+                last_sample, last_consumed = now, consumed
+    finally:
+        stop.set()
+        producer.join()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'offered_ticks_per_s': rate,
+        'batch_size': batch_size,
+        'batches_per_s': batches_per_sec,
+        'tokens': len(universe),
+        'duration_s': elapsed,
+        'produced_ticks': produced['ticks'],
+        'consumed_ticks': consumed,
+        'dropped_ticks': produced['dropped'],
+        'generator_behind_batches': produced['behind'],
+        'sustained_ticks_per_s': consumed / elapsed if elapsed else 0.0,
+        'final_queue_batches': batches.qsize(),
+        'callback_latency': callback_hist.summary(),
+        'end_to_end_latency': e2e_hist.summary(),
+        'samples': samples,
+        'soak': analyze_soak(samples),
+    }
+
+
+def analyze_soak(samples, warmup_fraction=0.1, leak_mb_per_hour=50.0, min_growth_mb=20.0, drift_ratio=1.5):
+    """
+    Flags a memory leak when post-warmup RSS grows faster than leak_mb_per_hour and by more than
+    min_growth_mb in total (so short runs are not judged on allocator noise), and latency drift
+    when the median interval p99 of the last quarter exceeds the first quarter's by drift_ratio.
+    """
+    steady = samples[int(len(samples) * warmup_fraction):]
+    if len(steady) < 4:
+        return {'samples': len(steady), 'memory_leak': None, 'latency_drift': None}
+    t = np.array([s['elapsed_s'] for s in steady]) / 3600.0
+    rss = np.array([s['rss_mb'] for s in steady])
+    rss_slope = float(np.polyfit(t, rss, 1)[0]) if t[-1] > t[0] else 0.0
+    p99 = np.array([np.nan if s['p99_ms'] is None else s['p99_ms'] for s in steady])
+    quarter = max(len(p99) // 4, 1)
+    first, last = np.nanmedian(p99[:quarter]), np.nanmedian(p99[-quarter:])
+    ratio = float(last / first) if first and not np.isnan(first) else None
+    queue_slope = float(np.polyfit(t, [s['queue_batches'] for s in steady], 1)[0]) if t[-1] > t[0] else 0.0
+    return {
+        'samples': len(steady),
+        'rss_mb_per_hour': rss_slope,
+        'rss_growth_mb': float(rss[-1] - rss[0]),
+        'memory_leak': rss_slope > leak_mb_per_hour and rss[-1] - rss[0] > min_growth_mb,
+        'p99_first_quarter_ms': None if np.isnan(first) else float(first),
+        'p99_last_quarter_ms': None if np.isnan(last) else float(last),
+        'latency_drift': None if ratio is None else ratio > drift_ratio,
+        'queue_batches_per_hour': queue_slope,
+    }
+
+
+def print_report(report):
+    print(f"📊 Offered {report['offered_ticks_per_s']} ticks/s over {report['tokens']} tokens "
+          f"({report['batches_per_s']} batches/s of {report['batch_size']}) for {report['duration_s']:.0f}s")
+    print(f"   Sustained: {report['sustained_ticks_per_s']:.0f} ticks/s | dropped: {report['dropped_ticks']} | "
+          f"queue at end: {report['final_queue_batches']} batches")
+    if report['generator_behind_batches']:
+        print(f"   ⚠️ Generator fell behind schedule on {report['generator_behind_batches']} batches; "
+              f"the offered rate was not fully delivered")
+    print(f"   Callback latency: {report['callback_latency']}")
+    print(f"   End-to-end latency: {report['end_to_end_latency']}")
+    if report['samples']:
+        last = report['samples'][-1]
+        print(f"   RSS: {last['rss_mb']:.1f} MB | written: {last['written_mb']} MB | on disk: {last['disk_mb']} MB")
+    soak = report['soak']
+    if soak.get('memory_leak') is not None:
+        print(f"   Soak: RSS {soak['rss_mb_per_hour']:+.1f} MB/h (leak: {soak['memory_leak']}), "
+              f"p99 {soak['p99_first_quarter_ms']} -> {soak['p99_last_quarter_ms']} ms "
+              f"(drift: {soak['latency_drift']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic tick load / soak test for kite_ws.on_ticks")
+    parser.add_argument('--rate', type=int, default=1000, help="offered ticks per second")
+    parser.add_argument('--tokens', type=int, default=500, help="number of instrument tokens")
+    parser.add_argument('--duration', type=float, default=60, help="run length in seconds")
+    parser.add_argument('--soak-hours', type=float, default=None, help="soak test length in hours (overrides --duration)")
+    parser.add_argument('--batches-per-sec', type=int, default=10)
+    parser.add_argument('--sample-interval', type=float, default=5.0, help="seconds between samples")
+    parser.add_argument('--output-dir', default=None, help="live data directory for the run (default: temp dir)")
+    parser.add_argument('--report', default=None, help="write the JSON report to this path")
+    parser.add_argument('--verbose', action='store_true', help="keep on_ticks console output")
+    args = parser.parse_args()
+
+    from utils import kite_ws
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix='kite_load_')
+    os.makedirs(output_dir, exist_ok=True)
+    kite_ws.LIVE_DATA_DIR = output_dir  # keep synthetic ticks out of the real live data
+    universe = build_universe(args.tokens, kite_ws.df, kite_ws.tokens_dict)
+    duration = args.soak_hours * 3600 if args.soak_hours else args.duration
+    print(f"🚀 Load test: {args.rate} ticks/s, {len(universe)} tokens, {duration:.0f}s, output in {output_dir}")
+
+    def on_sample(sample):
+        print(f"⏱️ {json.dumps({k: (round(v, 3) if isinstance(v, float) else v) for k, v in sample.items()})}",
+              file=sys.__stdout__)
+
+    with open(os.devnull, 'w') as devnull, \
+            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+        report = run_load(kite_ws.on_ticks, universe, args.rate, duration, batches_per_sec=args.batches_per_sec,
+                          sample_interval=args.sample_interval, output_dir=output_dir, on_sample=on_sample)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
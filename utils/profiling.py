@@ -0,0 +1,301 @@
+import collections
+import cProfile
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+PROFILE_ROOT = os.path.join('results', 'profiles')
+PROFILE_ENV = 'KITE_PROFILE'
+# 'timers' records stage timings only; 'cprofile' and 'sample' also capture a whole-run profile
+PROFILE_MODES = ('timers', 'cprofile', 'sample')
+
+
+class _StageTimer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _SymbolScope:
+    __slots__ = ('profiler', 'symbol', 'previous', 'start')
+
+    def __init__(self, profiler, symbol):
+        self.profiler = profiler
+        self.symbol = symbol
+
+    def __enter__(self):
+        self.previous = self.profiler.current_symbol
+        self.profiler.current_symbol = self.symbol
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        totals = self.profiler.symbol_totals
+        totals[self.symbol] = totals.get(self.symbol, 0.0) + elapsed
+        self.profiler.current_symbol = self.previous
+        return False
+
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class StackSampler:
+    """
+    Minimal sampling profiler: a background thread snapshots one thread's Python stack every
+    `interval` seconds and counts identical stacks. write_folded() emits the collapsed-stack
+    format read by flamegraph.pl and speedscope. Time spent in C code holding the GIL is
+    attributed to the Python frame that called it.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Named stage timers for the batch jobs, attributed to the symbol being processed.
+    Disabled by default, in which case stage() and symbol() return a shared no-op context.
+    Stages may nest; each records its own wall time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.mode = None
+        self.job = None
+        self.reset()
+
+    def reset(self):
+        self.current_symbol = None
+        self.stage_totals = {}
+        self.stage_calls = {}
+        self.symbol_stages = {}
+        self.symbol_totals = {}
+        self.started_at = None
+        self._start = None
+        self._cprofile = None
+        self._sampler = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _StageTimer(self, name)
+
+    def symbol(self, symbol):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _SymbolScope(self, symbol)
+
+    def iterate(self, name, iterable):
+        """
+        Yield from iterable, recording the time spent producing each item under stage `name`
+        (e.g. reading the next chunk from a pandas chunked reader).
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def record(self, name, seconds):
+        self.stage_totals[name] = self.stage_totals.get(name, 0.0) + seconds
+        self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+        if self.current_symbol is not None:
+            stages = self.symbol_stages.setdefault(self.current_symbol, {})
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    def start(self, job, mode='timers'):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {', '.join(PROFILE_MODES)}")
+        self.reset()
+        self.enabled = True
+        self.job = job
+        self.mode = mode
+        self.started_at = datetime.datetime.now()
+        self._start = time.perf_counter()
+        if mode == 'cprofile':
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif mode == 'sample':
+            self._sampler = StackSampler()
+            self._sampler.start()
+
+    def finish(self, output_dir=PROFILE_ROOT, top_n=10):
+        """
+        Stop profiling, write the JSON report (plus the .prof / .folded capture) and print
+        the stage and slowest-symbol tables. Returns the report dict.
+        """
+        if not self.enabled:
+            return None
+        wall = time.perf_counter() - self._start
+        self.enabled = False
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, f"{self.job}_{self.started_at.strftime('%Y%m%d_%H%M%S')}")
+
+        capture = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            capture = base + '.prof'
+            self._cprofile.dump_stats(capture)
+        elif self._sampler is not None:
+            self._sampler.stop()
+            capture = base + '.folded'
+            self._sampler.write_folded(capture)
+
+        report = self.report(wall, top_n)
+        report['capture'] = capture
+        with open(base + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        print_report(report)
+        print(f"⏱️ Profile report saved to `{base}.json`")
+        if capture:
+            print(f"⏱️ {self.mode} capture saved to `{capture}`")
+        return report
+
+    def report(self, wall, top_n=10):
+        symbols = {
+            symbol: {
+                'total': round(self.symbol_totals.get(symbol, sum(stages.values())), 6),
+                'stages': {name: round(seconds, 6) for name, seconds in stages.items()},
+            }
+            for symbol, stages in self.symbol_stages.items()
+        }
+        for symbol, total in self.symbol_totals.items():
+            symbols.setdefault(symbol, {'total': round(total, 6), 'stages': {}})
+        slowest = sorted(symbols.items(), key=lambda item: item[1]['total'], reverse=True)[:top_n]
+        return {
+            'job': self.job,
+            'mode': self.mode,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_seconds': round(wall, 6),
+            'stages': {
+                name: {'seconds': round(seconds, 6), 'calls': self.stage_calls[name]}
+                for name, seconds in sorted(self.stage_totals.items(), key=lambda item: item[1], reverse=True)
+            },
+            'symbols': symbols,
+            'slowest_symbols': [dict(symbol=symbol, **timing) for symbol, timing in slowest],
+        }
+
+
+def print_report(report):
+    wall = report['wall_seconds']
+    print(f"\n⏱️ {report['job']} ({report['mode']}): {wall:.3f}s wall")
+    print(f"{'stage':<20}{'seconds':>12}{'calls':>10}{'% wall':>9}")
+    for name, stage in report['stages'].items():
+        share = stage['seconds'] / wall if wall else 0.0
+        print(f"{name:<20}{stage['seconds']:>12.3f}{stage['calls']:>10}{share:>9.1%}")
+    slowest = report['slowest_symbols']
+    if slowest:
+        print(f"\nTop {len(slowest)} slowest symbols")
+        print(f"{'symbol':<20}{'seconds':>12}  slowest stage")
+        for entry in slowest:
+            stages = entry['stages']
+            worst = max(stages, key=stages.get) if stages else '-'
+            detail = f"{worst} ({stages[worst]:.3f}s)" if stages else '-'
+            print(f"{entry['symbol']:<20}{entry['total']:>12.3f}  {detail}")
+
+
+def profile_mode(argv=None):
+    """
+    Returns the requested profile mode, or None when profiling is off.
+    `--profile` / `--profile=<mode>` on the command line takes precedence over the
+    KITE_PROFILE environment variable (1/timers, cprofile, sample; 0/off disables).
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    value = None
+    for arg in argv:
+        if arg == '--profile':
+            value = 'timers'
+        elif arg.startswith('--profile='):
+            value = arg.split('=', 1)[1]
+    if value is None:
+        value = os.environ.get(PROFILE_ENV, '')
+    value = value.strip().lower()
+    if value in ('', '0', 'off', 'false', 'no'):
+        return None
+    if value in ('1', 'on', 'true', 'yes'):
+        return 'timers'
+    return value
+
+
+def profiled_job(job):
+    """
+    Decorator for a batch job's main(): when profiling is requested, times the whole run
+    and writes the report under results/profiles/ on exit, even if the job fails.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            mode = profile_mode()
+            if mode is None:
+                return func(*args, **kwargs)
+            profiler.start(job, mode)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.finish()
+        return wrapper
+    return decorator
+
+
+profiler = Profiler()
@@ -0,0 +1,235 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .compact_live_data import (
+    COMPACT_ROOT,
+    DEPTH_LEVELS,
+    FILE_PARTITIONS,
+    INDEX_FILENAME,
+    LIVE_ROOT,
+    build_partition_index,
+    load_live_records,
+    load_partition,
+    merge_columns,
+    partition_name,
+    records_to_columns,
+    source_stat,
+)
+from .instrument_utils import get_all_instruments
+
+
+def list_days(compact_root=COMPACT_ROOT, live_root=LIVE_ROOT):
+    """
+    Returns all recorded days (compacted or still raw JSON), oldest first.
+    """
+    days = set()
+    for root in (compact_root, live_root):
+        if os.path.isdir(root):
+            days.update(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    return sorted(days)
+
+
+def resolve_option_tokens(underlying, strike=None, expiry=None, option_type=None, instruments_df=None):
+    """
+    Returns instrument tokens from the instruments master for an underlying's options,
+    optionally narrowed by strike, expiry ('YYYY-MM-DD') and option type ('CE'/'PE').
+    """
+    df = get_all_instruments() if instruments_df is None else instruments_df
+    cond = (df['name'] == underlying) & (df['segment'] == 'NFO-OPT')
+    if strike is not None:
+        strikes = strike if isinstance(strike, (list, tuple, set)) else [strike]
+        cond = cond & df['strike'].isin([float(s) for s in strikes])
+    if expiry is not None:
+        cond = cond & (df['expiry'].astype(str) == str(expiry))
+    if option_type is not None:
+        cond = cond & (df['instrument_type'] == option_type)
+    return [int(t) for t in df.loc[cond, 'instrument_token']]
+
+
+def _load_day_index(day, compact_root):
+    path = os.path.join(compact_root, day, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _live_partitions(day, live_root, index, underlying=None, instrument_type=None):
+    """
+    Returns {(underlying, instrument_type): columns} parsed from the live JSON still present for
+    a day. Files outside the underlying/instrument_type filters are not read, nor are files whose
+    size and mtime match what index.json recorded when they were compacted.
+    """
+    live_dir = os.path.join(live_root, day)
+    if not os.path.isdir(live_dir):
+        return {}
+    compacted = {(entry['underlying'], entry['instrument_type']): entry.get('sources', {})
+                 for entry in index.values()}
+    grouped = {}
+    for filename, partition in FILE_PARTITIONS.items():
+        if underlying is not None and partition[0] != underlying:
+            continue
+        if instrument_type is not None and partition[1] != instrument_type:
+            continue
+        path = os.path.join(live_dir, filename)
+        if not os.path.exists(path):
+            continue
+        if compacted.get(partition, {}).get(filename) == source_stat(path):
+            continue
+        grouped.setdefault(partition, []).extend(load_live_records(path))
+    return {partition: records_to_columns(records) for partition, records in grouped.items() if records}
+
+
+def _memory_partition(underlying, instrument_type, columns):
+    entry = build_partition_index(columns)
+    entry.update({'underlying': underlying, 'instrument_type': instrument_type})
+
+    def loader(cols, columns=columns):
+        return dict(columns) if cols is None else {c: columns[c] for c in cols if c in columns}
+    return partition_name(underlying, instrument_type), entry, loader
+
+
+def _day_partitions(day, compact_root, live_root, underlying=None, instrument_type=None):
+    """
+    Yields (name, index_entry, loader) for each partition of a day. Compacted partitions are
+    read from their .npz files; live JSON changed since the last compaction (or the whole day
+    if not yet compacted) is parsed in memory and merged into the matching compacted partition.
+    loader(columns) returns a dict of the requested arrays (all of them for None).
+    """
+    index = _load_day_index(day, compact_root) or {}
+    live = _live_partitions(day, live_root, index, underlying, instrument_type)
+    for name, entry in index.items():
+        partition = (entry['underlying'], entry['instrument_type'])
+        if partition in live:
+            columns = merge_columns(load_partition(day, name, compact_root), live.pop(partition))
+            yield _memory_partition(*partition, columns)
+            continue
+        path = os.path.join(compact_root, day, name)
+
+        def loader(columns, path=path):
+            with np.load(path) as data:
+                names = data.files if columns is None else [c for c in columns if c in data.files]
+                return {c: data[c] for c in names}
+        yield name, entry, loader
+
+    for (underlying, instrument_type), columns in live.items():
+        yield _memory_partition(underlying, instrument_type, columns)
+
+
+def _time_window(day, start, end):
+    """
+    Returns the [start, end) window for a day as datetime64[ms]; start/end are times of day
+    ('HH:MM', 'HH:MM:SS' or datetime.time), None meaning the whole day.
+    """
+    def at(value, default):
+        if value is None:
+            return np.datetime64(f"{day}T{default}", 'ms')
+        if isinstance(value, datetime.time):
+            value = value.isoformat()
+        return np.datetime64(f"{day}T{value}", 'ms')
+    lo = at(start, '00:00:00')
+    hi = at(end, '00:00:00') if end is not None else lo + np.timedelta64(1, 'D')
+    return lo, hi
+
+
+def iter_ticks(tokens=None, underlying=None, instrument_type=None, days=None, start=None, end=None,
+               columns=None, compact_root=COMPACT_ROOT, live_root=LIVE_ROOT):
+    """
+    Stream recorded ticks matching the filters, one block per (day, partition, token).
+    Each block is a dict of NumPy arrays sorted by exchange_timestamp, always including
+    instrument_token and exchange_timestamp.
+    Partitions and tokens whose index min/max timestamps fall outside the window are skipped
+    without loading; within a token's sorted block the window is found by binary search.
+    """
+    token_set = None if tokens is None else {int(t) for t in tokens}
+    wanted = None if columns is None else [c for c in columns if c not in ('instrument_token', 'exchange_timestamp')]
+    for day in (list_days(compact_root, live_root) if days is None else days):
+        lo, hi = _time_window(day, start, end)
+        for name, entry, loader in _day_partitions(day, compact_root, live_root, underlying, instrument_type):
+            if underlying is not None and entry['underlying'] != underlying:
+                continue
+            if instrument_type is not None and entry['instrument_type'] != instrument_type:
+                continue
+            if entry['min_timestamp'] is None or np.datetime64(entry['max_timestamp']) < lo \
+                    or np.datetime64(entry['min_timestamp']) >= hi:
+                continue
+            blocks = []
+            for token, block in entry['tokens'].items():
+                if token_set is not None and int(token) not in token_set:
+                    continue
+                if block['min_timestamp'] is None or np.datetime64(block['max_timestamp']) < lo \
+                        or np.datetime64(block['min_timestamp']) >= hi:
+                    continue
+                blocks.append((int(token), block['start'], block['stop']))
+            if not blocks:
+                continue
+
+            ts = loader(['exchange_timestamp'])['exchange_timestamp']
+            # Partitions are sorted on the int64 view (NaT first), so search on the same view
+            ts_int = ts.view(np.int64)
+            lo_int, hi_int = lo.astype(np.int64), hi.astype(np.int64)
+            data = None
+            for token, block_start, block_stop in blocks:
+                block_ts = ts_int[block_start:block_stop]
+                first = block_start + int(np.searchsorted(block_ts, lo_int, side='left'))
+                last = block_start + int(np.searchsorted(block_ts, hi_int, side='left'))
+                if first >= last:
+                    continue
+                if data is None:
+                    # Load the remaining columns only once a block is known to match
+                    data = loader(wanted)
+                result = {
+                    'instrument_token': np.full(last - first, token, dtype=np.int64),
+                    'exchange_timestamp': ts[first:last],
+                }
+                for col, values in data.items():
+                    if col not in result:
+                        result[col] = values[first:last]
+                yield result
+
+
+def query_ticks(tokens=None, underlying=None, instrument_type=None, strike=None, expiry=None, option_type=None,
+                days=None, start=None, end=None, columns=None, as_frame=False, instruments_df=None,
+                compact_root=COMPACT_ROOT, live_root=LIVE_ROOT):
+    """
+    Collect recorded ticks for the filters into one dict of NumPy arrays (or a DataFrame with
+    as_frame=True), ordered by day, partition, token and exchange_timestamp.
+    strike/expiry/option_type resolve option tokens for the underlying through the instruments master.
+    Example: ticks for token X between 10:15 and 10:20 on two days:
+        query_ticks(tokens=[X], days=['2025-09-29', '2025-09-30'], start='10:15', end='10:20')
+    """
+    if strike is not None or expiry is not None or option_type is not None:
+        if underlying is None:
+            raise ValueError("underlying is required to filter by strike, expiry or option_type")
+        option_tokens = resolve_option_tokens(underlying, strike, expiry, option_type, instruments_df)
+        if tokens is not None:
+            option_tokens = sorted(set(option_tokens) & {int(t) for t in tokens})
+        tokens = option_tokens
+        instrument_type = instrument_type or 'OPT'
+    blocks = list(iter_ticks(tokens, underlying, instrument_type, days, start, end, columns,
+                             compact_root, live_root))
+    if blocks:
+        result = {col: np.concatenate([b[col] for b in blocks]) for col in blocks[0]}
+    else:
+        result = {'instrument_token': np.array([], dtype=np.int64),
+                  'exchange_timestamp': np.array([], dtype='datetime64[ms]')}
+    return ticks_to_frame(result) if as_frame else result
+
+
+def ticks_to_frame(ticks):
+    """
+    Convert a dict of tick arrays to a DataFrame, splitting depth matrices into per-level columns
+    (bid_price_1 .. bid_price_5 etc.).
+    """
+    flat = {}
+    for col, values in ticks.items():
+        if values.ndim == 2:
+            for level in range(min(values.shape[1], DEPTH_LEVELS)):
+                flat[f"{col}_{level + 1}"] = values[:, level]
+        else:
+            flat[col] = values
+    return pd.DataFrame(flat)